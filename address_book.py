@@ -1,64 +1,242 @@
+import asyncio
 import json
 import os
+import tempfile
+import threading
 import time
+from contextlib import contextmanager
 
 ADDRESS_FILE = "addresses.json"
 LOCK_FILE = "addresses.json.lock"
 
-def acquire_lock(timeout=5):
-    """Acquires a file-based lock, waiting up to the timeout."""
-    start_time = time.time()
-    while True:
+# How often (in seconds) the resolver re-stats the address file for changes.
+ADDRESS_POLL_INTERVAL = float(os.getenv("ADDRESS_POLL_INTERVAL", "0.5"))
+
+# --- Replica Configuration ---
+# Replicated roles map to {address: last heartbeat (Unix time)} instead of a single address.
+REPLICA_HEARTBEAT_INTERVAL = float(os.getenv("REPLICA_HEARTBEAT_INTERVAL", "5"))
+# A replica that hasn't sent a heartbeat for this long is considered dead
+REPLICA_TTL = float(os.getenv("REPLICA_TTL", "15"))
+# -----------------------------
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows; writes are still atomic, just not serialized
+    fcntl = None
+
+@contextmanager
+def registry_lock():
+    """
+    Holds an exclusive OS advisory lock on LOCK_FILE for the duration of the block.
+    The kernel releases the lock when the holder exits or crashes, so a stale
+    lock file on disk never blocks later writers.
+    """
+    with open(LOCK_FILE, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
         try:
-            # Attempt to create the lock file in exclusive mode
-            with open(LOCK_FILE, 'x') as f:
-                return True # Lock acquired
-        except FileExistsError:
-            if time.time() - start_time > timeout:
-                raise TimeoutError(f"Could not acquire lock on {ADDRESS_FILE} within {timeout} seconds.")
-            time.sleep(0.1)
-
-def release_lock():
-    """Releases the file-based lock."""
-    if os.path.exists(LOCK_FILE):
-        os.remove(LOCK_FILE)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
 
-def save_address(name: str, address: str):
-    """Saves an agent's address to the shared address file using a file lock."""
+def _read_addresses() -> dict:
+    """Reads the address file, treating a missing or corrupt file as empty."""
     try:
-        acquire_lock()
-        addresses = {}
-        if os.path.exists(ADDRESS_FILE):
-            with open(ADDRESS_FILE, "r") as f:
-                try:
-                    addresses = json.load(f)
-                except json.JSONDecodeError:
-                    pass # File is empty or corrupt, will overwrite
-        
-        addresses[name] = address
-        
-        with open(ADDRESS_FILE, "w") as f:
+        with open(ADDRESS_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        return {} # File is empty or corrupt, will overwrite
+
+def _write_addresses(addresses: dict):
+    """Writes the address file atomically: readers see either the old or the new file, never a partial one."""
+    directory = os.path.dirname(os.path.abspath(ADDRESS_FILE))
+    fd, tmp_path = tempfile.mkstemp(prefix=".addresses.", suffix=".tmp", dir=directory)
+    try:
+        os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, "w") as f:
             json.dump(addresses, f, indent=4)
-    finally:
-        release_lock()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, ADDRESS_FILE)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class AddressResolver:
+    """
+    Process-local view of the address file.
+    The file is parsed once and only re-read when its mtime/size/inode changes,
+    so lookups on the message path are a dict access plus an occasional stat().
+    """
+
+    def __init__(self, path: str = ADDRESS_FILE, poll_interval: float = ADDRESS_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._addresses: dict[str, str] = {}
+        self._local: dict[str, str] = {}
+        self._signature = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registers callback(addresses) to be called whenever the address file changes."""
+        self._listeners.append(callback)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reloads the address file if it changed on disk. Returns True if any address changed."""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.poll_interval:
+            return False
+
+        with self._lock:
+            self._last_check = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return False
+            signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            if signature == self._signature:
+                return False
+            try:
+                with open(self.path, "r") as f:
+                    addresses = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                return False # File might be being written to, try again on the next poll
+            self._signature = signature
+            changed = addresses != self._addresses
+            self._addresses = addresses
+
+        if changed:
+            for listener in list(self._listeners):
+                listener(dict(addresses))
+        return changed
+
+    def register_local(self, name: str, address: str):
+        """Pins a role to an agent running in this process. Local roles resolve without touching the file."""
+        self._local[name] = address
+
+    def replicas(self, name: str) -> list[str]:
+        """Returns every live address for a role; a single-address role has one."""
+        if name in self._local:
+            return [self._local[name]]
+        self.refresh()
+        entry = self._addresses.get(name)
+        if not entry:
+            self.refresh(force=True)
+            entry = self._addresses.get(name)
+        if isinstance(entry, dict):
+            cutoff = time.time() - REPLICA_TTL
+            return [address for address, heartbeat in entry.items() if heartbeat > cutoff]
+        return [entry] if entry else []
+
+    def get(self, name: str) -> str | None:
+        """Returns the address for a role (the most recently seen replica if it has several), or None."""
+        address = self._local.get(name)
+        if address:
+            return address
+        self.refresh()
+        entry = self._addresses.get(name)
+        if not entry:
+            self.refresh(force=True)
+            entry = self._addresses.get(name)
+        if isinstance(entry, dict):
+            live = {address: heartbeat for address, heartbeat in entry.items() if heartbeat > time.time() - REPLICA_TTL}
+            return max(live, key=live.get) if live else None
+        return entry
+
+    def snapshot(self) -> dict[str, str]:
+        """Returns a copy of all currently known addresses."""
+        self.refresh()
+        return {**self._addresses, **self._local}
+
+    async def wait_for(self, name: str, timeout: float = 5.0) -> str | None:
+        """Waits without blocking the event loop until a role has an address, or the timeout passes."""
+        deadline = time.monotonic() + timeout
+        while True:
+            address = self.get(name)
+            if address or time.monotonic() >= deadline:
+                return address
+            await asyncio.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+resolver = AddressResolver()
+
+def save_addresses(entries: dict[str, str]):
+    """Saves several agents' addresses to the shared address file in a single locked update."""
+    with registry_lock():
+        addresses = _read_addresses()
+        addresses.update(entries)
+        _write_addresses(addresses)
+    resolver.refresh(force=True)
+
+def save_address(name: str, address: str):
+    """Saves an agent's address to the shared address file."""
+    save_addresses({name: address})
+
+def heartbeat_replica(name: str, address: str):
+    """Registers one replica of a role, or renews its heartbeat, dropping replicas that have died."""
+    now = time.time()
+    with registry_lock():
+        addresses = _read_addresses()
+        entry = addresses.get(name)
+        replicas = {a: heartbeat for a, heartbeat in entry.items() if heartbeat > now - REPLICA_TTL} if isinstance(entry, dict) else {}
+        replicas[address] = now
+        addresses[name] = replicas
+        _write_addresses(addresses)
+    resolver.refresh(force=True)
+
+def remove_replica(name: str, address: str):
+    """Deregisters a replica, e.g. when it shuts down cleanly."""
+    with registry_lock():
+        addresses = _read_addresses()
+        entry = addresses.get(name)
+        if isinstance(entry, dict) and entry.pop(address, None) is not None:
+            _write_addresses(addresses)
+    resolver.refresh(force=True)
+
+def attach_replica(agent, name: str, interval: float = REPLICA_HEARTBEAT_INTERVAL):
+    """Registers the agent as a replica of `name` while it runs, with a heartbeat every `interval` seconds."""
+
+    @agent.on_event("startup")
+    async def register_replica(ctx):
+        await asyncio.to_thread(heartbeat_replica, name, agent.address)
+
+    @agent.on_interval(period=interval)
+    async def send_replica_heartbeat(ctx):
+        # Off the event loop: the update takes a file lock and fsyncs
+        await asyncio.to_thread(heartbeat_replica, name, agent.address)
+
+    @agent.on_event("shutdown")
+    async def deregister_replica(ctx):
+        remove_replica(name, agent.address)
+
+def register_local_address(name: str, address: str):
+    """Makes this process resolve a role to an agent it runs itself, e.g. under a Bureau."""
+    resolver.register_local(name, address)
 
 def get_address(name: str, retries: int = 5, delay: int = 1) -> str:
     """
     Retrieves an agent's address from the shared address file.
     Retries if the address is not found immediately.
+    This blocks between retries; async code should use wait_for_address instead.
     """
     for i in range(retries):
-        if os.path.exists(ADDRESS_FILE):
-            with open(ADDRESS_FILE, "r") as f:
-                try:
-                    addresses = json.load(f)
-                    address = addresses.get(name)
-                    if address:
-                        return address
-                except (json.JSONDecodeError, KeyError):
-                    pass  # File might be being written to or key doesn't exist yet
-        
+        address = resolver.get(name)
+        if address:
+            return address
+
         if i < retries - 1:
             time.sleep(delay)
-            
+
     raise ValueError(f"Address for '{name}' not found in {ADDRESS_FILE} after {retries} retries.")
+
+async def wait_for_address(name: str, timeout: float = 5.0) -> str | None:
+    """
+    Resolves an agent's address from the in-memory cache, awaiting it if the role
+    has not registered yet. Returns None if it is still missing after the timeout.
+    """
+    return await resolver.wait_for(name, timeout=timeout)
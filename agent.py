@@ -1,7 +1,8 @@
+import asyncio
 import json
+import os
 from datetime import datetime, timezone
 from uuid import uuid4
-import httpx
 from uagents import Agent, Context, Protocol
 from uagents.setup import fund_agent_if_low
 from uagents_core.contrib.protocols.chat import (
@@ -12,32 +13,71 @@ from uagents_core.contrib.protocols.chat import (
 )
 from uagents_core.types import DeliveryStatus
 
-from address_book import get_address, save_address
+from address_book import save_address
+from balancer import ReplicaBalancer
+from cache import TTLCache
+from deadlines import drop_if_expired, forward, hop_timeout
+from http_client import HttpClientPool
+from outbox import SessionOutbox
+from scheduler import PriorityScheduler
+import metrics
+import tracing
 from models import (
-    StrategyRequest, StrategyResponse, ExecuteStrategy, ExecutionResult, 
+    TraceContext, StrategyRequest, StrategyResponse, StrategyChunk, ExecuteStrategy, ExecutionResult, PrebuildTransaction,
     StrategyProposal, CommandMessage, SubmitSignedTransaction, 
     UnsignedTransactionProposal, StatusMessage
 )
 
-API_URL = "http://127.0.0.1:5001/api/agent-response"
+# Any API worker (or a load balancer in front of them) can take the replies
+API_URL = os.getenv("API_RESPONSES_URL", "http://127.0.0.1:5001/api/agent-responses")
 
 agent = Agent(
     name="martian_user_agent",
     port=8001,
     seed="martian_user_agent_secret_seed_phrase",
     endpoint=["http://127.0.0.1:8001/submit"],
+    # A chat handler waits for its StrategyResponse, which is delivered by another handler;
+    # handled one at a time, the reply (and every StrategyChunk) would queue behind it
+    handle_messages_concurrently=True,
 )
 
 chat_proto = Protocol(spec=chat_protocol_spec)
 command_proto = Protocol("CommandProtocol", version="1.0")
+strategy_reply_proto = Protocol("StrategyReplies", version="1.0")
 
-async def send_response_to_api(session_id: str, content: str):
-    """Sends a response back to the API for a specific session."""
-    try:
-        async with httpx.AsyncClient() as client:
-            await client.post(API_URL, json={"session_id": session_id, "content": content}, timeout=30)
-    except httpx.RequestError as e:
-        print(f"Error sending response to API: {e}")
+# Ask the Strategy Agent to stream the proposal while it is being generated
+STRATEGY_STREAMING = os.getenv("STRATEGY_STREAMING", "1") == "1"
+# Have the Execution Agent build each proposal's transaction as soon as it is shown, so an
+# execute can be answered without waiting for the onchain build
+SPECULATIVE_PREBUILD = os.getenv("SPECULATIVE_PREBUILD", "0") == "1"
+
+# Requests are spread over every live replica of these roles
+strategy_balancer = ReplicaBalancer("strategy_agent")
+# Prebuild, execute and submit for one strategy_id go to the same replica (affinity), so they
+# find the transaction it pre-built and its record of submissions
+execution_balancer = ReplicaBalancer("execution_agent")
+
+# Signed transactions go ahead of execute builds, which go ahead of new strategy queries
+scheduler = PriorityScheduler("user_agent")
+COMMAND_PRIORITIES = {"submit_signed_tx": "submit", "execute": "execute"}
+
+# Each session's wallet, from the chat message or its last execute, to pre-build transactions for
+session_fee_payers = TTLCache("user_agent.fee_payers", ttl=3600, max_entries=10000)
+
+http_pool = HttpClientPool("user_agent")
+outbox = SessionOutbox(http_pool, API_URL)
+
+# Shutdown handlers run in registration order: flush the outbox before the pool it posts through is closed
+@agent.on_event("shutdown")
+async def flush_outbox(ctx: Context):
+    await outbox.close()
+
+http_pool.attach(agent)
+metrics.attach(agent)
+
+async def send_response_to_api(session_id: str, content):
+    """Queues a response (text or Model) for delivery to the API for a specific session."""
+    await outbox.put(session_id, content)
 
 def create_text_chat(text: str) -> ChatMessage:
     content = [TextContent(type="text", text=text)]
@@ -47,15 +87,60 @@ def create_text_chat(text: str) -> ChatMessage:
         content=content,
     )
 
-STRATEGY_AGENT_ADDRESS = get_address("strategy_agent")
-EXECUTION_AGENT_ADDRESS = get_address("execution_agent")
+# Strategy requests waiting for their StrategyResponse, by request_id
+pending_strategy_responses: dict[str, asyncio.Future] = {}
+
+async def request_strategy(ctx: Context, strategy_agent_address: str, request: StrategyRequest, timeout: float) -> StrategyResponse | None:
+    """
+    Sends a StrategyRequest and waits for the StrategyResponse carrying its request_id,
+    which handle_strategy_response delivers. A reply that arrives after the request
+    timed out finds no waiter and is dropped, rather than answering a later request.
+    """
+    future = asyncio.get_running_loop().create_future()
+    pending_strategy_responses[request.request_id] = future
+    try:
+        status = await ctx.send(strategy_agent_address, request)
+        if status.status == DeliveryStatus.FAILED:
+            ctx.logger.error(f"Failed to deliver strategy request: {status.detail}")
+            strategy_balancer.report_failure(strategy_agent_address)
+            return None
+        return await asyncio.wait_for(future, timeout=timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        pending_strategy_responses.pop(request.request_id, None)
+
+@strategy_reply_proto.on_message(StrategyChunk)
+async def handle_strategy_chunk(ctx: Context, sender: str, msg: StrategyChunk):
+    await send_response_to_api(msg.session_id, msg)
+
+@strategy_reply_proto.on_message(StrategyResponse)
+async def handle_strategy_response(ctx: Context, sender: str, msg: StrategyResponse):
+    future = pending_strategy_responses.get(msg.request_id)
+    if future is None or future.done():
+        ctx.logger.warning(f"Dropping strategy response {msg.request_id} for session {msg.session_id}: its request is no longer waiting")
+        return
+    future.set_result(msg)
+
+def chat_trace(msg: ChatMessage) -> TraceContext | None:
+    """The API puts the trace context in the chat message's JSON text, next to the session_id."""
+    for item in msg.content:
+        if isinstance(item, TextContent):
+            try:
+                trace = json.loads(item.text).get("trace")
+                return TraceContext(**trace) if trace else None
+            except (json.JSONDecodeError, TypeError, AttributeError, ValueError):
+                return None
+    return None
 
 @chat_proto.on_message(ChatMessage)
+@tracing.traced_handler("user_agent.handle_chat", extract=chat_trace)
 async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
     ctx.logger.info(f"Received chat message from {sender}")
     await ctx.send(sender, ChatAcknowledgement(timestamp=datetime.now(timezone.utc), acknowledged_msg_id=msg.msg_id))
     session_id = None
     user_query = None
+    deadline = None
 
     for item in msg.content:
         if isinstance(item, TextContent):
@@ -63,6 +148,9 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
                 data = json.loads(item.text)
                 user_query = data.get('text')
                 session_id = data.get('session_id')
+                deadline = data.get('deadline')
+                if session_id and data.get('feePayer'):
+                    session_fee_payers.put(session_id, data['feePayer'])
                 break
             except (json.JSONDecodeError, TypeError):
                 ctx.logger.error("Could not parse chat message content")
@@ -74,51 +162,97 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
 
     ctx.logger.info(f"User query for session {session_id}: {user_query}")
 
-    await send_response_to_api(session_id, StatusMessage(message="Formulating strategy...", agent_name="Strategy Agent", progress=0.1, timestamp=datetime.now(timezone.utc).isoformat()).model_dump_json())
+    await send_response_to_api(session_id, StatusMessage(message="Formulating strategy...", agent_name="Strategy Agent", progress=0.1, timestamp=datetime.now(timezone.utc).isoformat()))
 
-    strategy_agent_address = get_address("strategy_agent")
-    if not strategy_agent_address:
-        error_msg = "Strategy Agent not found. Please ensure it is running."
-        await send_response_to_api(session_id, error_msg)
-        return
+    # New queries wait behind submissions and execute builds, and their deadline may pass while they do
+    async with scheduler.slot("chat"):
+        if drop_if_expired(ctx, "user_agent.chat", deadline):
+            await send_response_to_api(session_id, "The request timed out before it could be processed. Please try again.")
+            return
 
-    strategy_response, status = await ctx.send_and_receive(
-        strategy_agent_address,
-        StrategyRequest(user_query=user_query, session_id=session_id),
-        StrategyResponse,
-        timeout=240
-    )
+        async with strategy_balancer.acquire() as strategy_agent_address:
+            if not strategy_agent_address:
+                error_msg = "Strategy Agent not found. Please ensure it is running."
+                await send_response_to_api(session_id, error_msg)
+                return
 
-    if not (status.status == DeliveryStatus.DELIVERED and isinstance(strategy_response, StrategyResponse)):
+            with tracing.span("user_agent.strategy_request", session_id=session_id, replica=strategy_agent_address) as hop:
+                strategy_response = await request_strategy(
+                    ctx,
+                    strategy_agent_address,
+                    StrategyRequest(
+                        user_query=user_query,
+                        session_id=session_id,
+                        stream=STRATEGY_STREAMING,
+                        request_id=str(uuid4()),
+                        deadline=forward(deadline),
+                        trace=hop.context(),
+                    ),
+                    timeout=hop_timeout(deadline, 240)
+                )
+
+    if not isinstance(strategy_response, StrategyResponse):
         error_msg = "Strategy Agent did not provide a valid response."
         await send_response_to_api(session_id, error_msg)
     else:
         await send_response_to_api(session_id, strategy_response.strategy_description)
+        if SPECULATIVE_PREBUILD:
+            await request_prebuild(ctx, session_id, strategy_response.strategy_description)
+
+async def request_prebuild(ctx: Context, session_id: str, strategy_description: str):
+    """Asks the Execution Agent to build the proposal's transaction ahead of the user's execute."""
+    fee_payer = session_fee_payers.get(session_id)
+    if fee_payer is None:
+        return # Nobody to build it for yet
+    try:
+        proposal = StrategyProposal.model_validate_json(strategy_description)
+    except ValueError:
+        return # An error message rather than a proposal
+
+    execution_agent_address = execution_balancer.pick(affinity=proposal.strategy_id)
+    if execution_agent_address:
+        with tracing.span("user_agent.prebuild_request") as hop:
+            await ctx.send(execution_agent_address, PrebuildTransaction(
+                strategy=proposal.description,
+                strategy_id=proposal.strategy_id,
+                feePayer=fee_payer,
+                trace=hop.context(),
+            ))
 
 @command_proto.on_message(CommandMessage)
+@tracing.traced_handler("user_agent.handle_command")
+@scheduler.prioritized(lambda msg: COMMAND_PRIORITIES.get(msg.command, "chat"))
 async def handle_command_message(ctx: Context, sender: str, msg: CommandMessage):
     ctx.logger.info(f"Received command from {sender}: {msg.command} for session {msg.session_id}")
     session_id = msg.session_id
+    if drop_if_expired(ctx, "user_agent.command", msg.deadline):
+        await send_response_to_api(session_id, "The request timed out before it could be processed. Please try again.")
+        return
 
     if msg.command == "execute":
         strategy_id = msg.payload.get("strategy_id")
         strategy_description = msg.payload.get("strategy_description")
         feePayer = msg.payload.get("feePayer")
+        if feePayer:
+            session_fee_payers.put(session_id, feePayer)
         ctx.logger.info(f"Executing strategy {strategy_id}: {strategy_description} with fee payer {feePayer}")
 
-        await send_response_to_api(session_id, StatusMessage(message="Preparing transaction...", agent_name="Execution Agent", progress=0.3, timestamp=datetime.now(timezone.utc).isoformat()).model_dump_json())
+        await send_response_to_api(session_id, StatusMessage(message="Preparing transaction...", agent_name="Execution Agent", progress=0.3, timestamp=datetime.now(timezone.utc).isoformat()))
 
-        execution_agent_address = get_address("execution_agent")
-        if not execution_agent_address:
-            await send_response_to_api(session_id, "Execution Agent not found.")
-            return
+        async with execution_balancer.acquire(affinity=strategy_id) as execution_agent_address:
+            if not execution_agent_address:
+                await send_response_to_api(session_id, "Execution Agent not found.")
+                return
 
-        execution_result, exec_status = await ctx.send_and_receive(
-            execution_agent_address,
-            ExecuteStrategy(strategy=strategy_description, strategy_id=strategy_id, feePayer=feePayer),
-            ExecutionResult,
-            timeout=60
-        )
+            with tracing.span("user_agent.execute_request") as hop:
+                execution_result, exec_status = await ctx.send_and_receive(
+                    execution_agent_address,
+                    ExecuteStrategy(strategy=strategy_description, strategy_id=strategy_id, feePayer=feePayer, deadline=forward(msg.deadline), trace=hop.context()),
+                    ExecutionResult,
+                    timeout=hop_timeout(msg.deadline, 60)
+                )
+            if exec_status and exec_status.status == DeliveryStatus.FAILED:
+                execution_balancer.report_failure(execution_agent_address)
 
         if not (exec_status.status == DeliveryStatus.DELIVERED and isinstance(execution_result, ExecutionResult)) or not execution_result.success:
             error_detail = execution_result.error if execution_result else (exec_status.detail if exec_status else 'timeout')
@@ -129,8 +263,8 @@ async def handle_command_message(ctx: Context, sender: str, msg: CommandMessage)
                 unsigned_tx_b64=execution_result.unsigned_tx_b64,
                 strategy_id=strategy_id
             )
-            await send_response_to_api(session_id, proposal.model_dump_json())
-            await send_response_to_api(session_id, StatusMessage(message="Transaction prepared. Waiting for user to sign...", agent_name="User Wallet", progress=0.5, timestamp=datetime.now(timezone.utc).isoformat()).model_dump_json())
+            await send_response_to_api(session_id, proposal)
+            await send_response_to_api(session_id, StatusMessage(message="Transaction prepared. Waiting for user to sign...", agent_name="User Wallet", progress=0.5, timestamp=datetime.now(timezone.utc).isoformat()))
         else:
             await send_response_to_api(session_id, f"Strategy {strategy_id} executed successfully. Hash: {execution_result.transaction_hash}")
 
@@ -139,19 +273,22 @@ async def handle_command_message(ctx: Context, sender: str, msg: CommandMessage)
         strategy_id = msg.payload.get("strategy_id")
         ctx.logger.info(f"Submitting signed tx for strategy {strategy_id}")
 
-        await send_response_to_api(session_id, StatusMessage(message="Submitting signed transaction...", agent_name="Execution Agent", progress=0.7, timestamp=datetime.now(timezone.utc).isoformat()).model_dump_json())
+        await send_response_to_api(session_id, StatusMessage(message="Submitting signed transaction...", agent_name="Execution Agent", progress=0.7, timestamp=datetime.now(timezone.utc).isoformat()))
 
-        execution_agent_address = get_address("execution_agent")
-        if not execution_agent_address:
-            await send_response_to_api(session_id, "Execution Agent not found.")
-            return
+        async with execution_balancer.acquire(affinity=strategy_id) as execution_agent_address:
+            if not execution_agent_address:
+                await send_response_to_api(session_id, "Execution Agent not found.")
+                return
 
-        execution_result, exec_status = await ctx.send_and_receive(
-            execution_agent_address,
-            SubmitSignedTransaction(signed_tx_b64=signed_tx_b64, strategy_id=strategy_id),
-            ExecutionResult,
-            timeout=60,
-        )
+            with tracing.span("user_agent.submit_request") as hop:
+                execution_result, exec_status = await ctx.send_and_receive(
+                    execution_agent_address,
+                    SubmitSignedTransaction(signed_tx_b64=signed_tx_b64, strategy_id=strategy_id, deadline=forward(msg.deadline), trace=hop.context()),
+                    ExecutionResult,
+                    timeout=hop_timeout(msg.deadline, 60),
+                )
+            if exec_status and exec_status.status == DeliveryStatus.FAILED:
+                execution_balancer.report_failure(execution_agent_address)
 
         if not (exec_status.status == DeliveryStatus.DELIVERED and isinstance(execution_result, ExecutionResult)) or not execution_result.success:
             error_detail = execution_result.error if execution_result else (exec_status.detail if exec_status else 'timeout')
@@ -168,6 +305,7 @@ async def handle_acknowledgement(ctx: Context, sender: str, msg: ChatAcknowledge
 
 agent.include(chat_proto, publish_manifest=True)
 agent.include(command_proto)
+agent.include(strategy_reply_proto)
 
 if __name__ == "__main__":
     save_address("user_agent", agent.address)
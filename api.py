@@ -1,54 +1,80 @@
-import asyncio
+import importlib.util
+import os
+
+# --- Async Mode Configuration ---
+# "eventlet", "gevent" or "threading"; by default the first of them that is installed
+API_ASYNC_MODE = os.getenv("API_ASYNC_MODE") or next(
+    mode for mode in ("eventlet", "gevent", "threading")
+    if mode == "threading" or importlib.util.find_spec(mode) is not None
+)
+# --------------------------------
+
+# Green threads only cooperate once the standard library is patched, so this runs before anything else is imported
+if API_ASYNC_MODE == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+elif API_ASYNC_MODE == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import json
 import logging
-import threading
 
 from uagents import Model
-from uagents.communication import send_sync_message
 from uagents.crypto import Identity
 from uagents_core.contrib.protocols.chat import ChatMessage, TextContent
 
 from agent import create_text_chat
 from address_book import get_address
+from deadlines import CHAT_REQUEST_BUDGET, COMMAND_REQUEST_BUDGET, deadline_after
+from message_dispatcher import AgentMessageDispatcher
 from models import CommandMessage
+from session_registry import session_registry_from_config
+import metrics
+import tracing
 
 # NOTE: Flask-SocketIO is required. Please install it with: pip install Flask-SocketIO eventlet
 
+# --- API Server Configuration ---
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "5001"))
+API_DEBUG = os.getenv("API_DEBUG", "0") == "1"
+# Routes emits between API workers so any worker can relay an agent reply to any client:
+# "redis://..." (or another Flask-SocketIO message_queue URL), or "file:<path>" for workers on one host.
+# Unset for a single worker. Clients must stick to one worker (sticky sessions) or use websocket only.
+API_MESSAGE_QUEUE = os.getenv("API_MESSAGE_QUEUE")
+# --------------------------------
+
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
-socketio = SocketIO(app, cors_allowed_origins="*")
+if API_MESSAGE_QUEUE and API_MESSAGE_QUEUE.startswith("file:"):
+    from socket_queue import FileMessageQueue
+    socketio = SocketIO(app, async_mode=API_ASYNC_MODE, cors_allowed_origins="*", client_manager=FileMessageQueue(API_MESSAGE_QUEUE[len("file:"):]))
+else:
+    socketio = SocketIO(app, async_mode=API_ASYNC_MODE, cors_allowed_origins="*", message_queue=API_MESSAGE_QUEUE)
 
 logging.basicConfig(level=logging.INFO)
 
 AGENT_ADDRESS = get_address("user_agent")
 api_identity = Identity.generate()
+dispatcher = AgentMessageDispatcher(AGENT_ADDRESS, api_identity)
 
-user_agent_sessions = {}
+# Sessions of connected clients, shared between API workers (API_SESSION_REGISTRY)
+user_agent_sessions = session_registry_from_config()
 
 @socketio.on('connect')
 def handle_connect():
     logging.info(f"Client connected: {request.sid}")
+    user_agent_sessions.add(request.sid)
     emit('response', {'status': 'success', 'message': 'Connected to Martian API'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     logging.info(f"Client disconnected: {request.sid}")
-    if request.sid in user_agent_sessions:
-        del user_agent_sessions[request.sid]
-
-def send_to_agent_thread(message):
-    """This function runs in a separate thread to send a message to the agent without blocking."""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    # We are not expecting a direct response here, so we can use a short timeout.
-    # The real responses will come back through the /api/agent-response endpoint.
-    loop.run_until_complete(
-        send_sync_message(AGENT_ADDRESS, message, sender=api_identity, timeout=10.0)
-    )
-    loop.close()
+    user_agent_sessions.remove(request.sid)
 
 @socketio.on('chat_message')
 def handle_chat_message(data):
@@ -59,7 +85,7 @@ def handle_chat_message(data):
 
     logging.info(f"Received chat message from {request.sid}: {message_text}")
     session_id = request.sid
-    user_agent_sessions[session_id] = True
+    user_agent_sessions.add(session_id)
 
     is_command = False
     parsed_message = None
@@ -72,23 +98,45 @@ def handle_chat_message(data):
         except json.JSONDecodeError:
             pass
 
-    message_to_send = None
-    if is_command:
-        message_to_send = CommandMessage(
-            command=parsed_message["command"],
-            payload=parsed_message.get("payload", {}),
-            session_id=session_id
-        )
-    else:
-        message_payload = json.dumps({"text": message_text, "session_id": session_id})
-        message_to_send = create_text_chat(message_payload)
-
-    # Run the blocking send_sync_message in a background thread
-    thread = threading.Thread(target=send_to_agent_thread, args=(message_to_send,))
-    thread.start()
+    with tracing.span("api.chat_message", session_id=session_id, command=is_command) as root_span:
+        message_to_send = None
+        if is_command:
+            message_to_send = CommandMessage(
+                command=parsed_message["command"],
+                payload=parsed_message.get("payload", {}),
+                session_id=session_id,
+                deadline=deadline_after(COMMAND_REQUEST_BUDGET),
+                trace=root_span.context()
+            )
+        else:
+            # feePayer is the client's connected wallet, if any, so its transactions can be built ahead of time
+            message_payload = json.dumps({
+                "text": message_text,
+                "session_id": session_id,
+                "feePayer": data.get('feePayer'),
+                "deadline": deadline_after(CHAT_REQUEST_BUDGET),
+                "trace": root_span.context().model_dump(),
+            })
+            message_to_send = create_text_chat(message_payload)
+
+        # Hand the message to the long-lived dispatcher loop; shed load if it is backed up
+        if not dispatcher.submit(message_to_send, parent=root_span):
+            root_span.set(overloaded=True)
+            logging.warning(f"Dispatcher queue full, rejecting message for session: {session_id}")
+            emit('overloaded', {'message': 'The server is busy, please try again shortly.', 'queue_depth': dispatcher.queue_depth})
+            return
 
     logging.info(f"Message forwarded to user agent for session: {session_id}")
 
+def relay_to_session(session_id, content):
+    """Emits one agent response to the client's room. Plain-text content is parsed if it holds JSON."""
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            pass
+    socketio.emit('agent_response', {'response': content}, room=session_id)
+
 @app.route("/api/agent-response", methods=["POST"])
 def handle_agent_response():
     data = request.get_json()
@@ -100,16 +148,38 @@ def handle_agent_response():
 
     if session_id in user_agent_sessions:
         logging.info(f"Relaying agent response to client {session_id}")
-        try:
-            parsed_content = json.loads(content)
-            socketio.emit('agent_response', {'response': parsed_content}, room=session_id)
-        except (json.JSONDecodeError, TypeError):
-            socketio.emit('agent_response', {'response': content}, room=session_id)
+        relay_to_session(session_id, content)
         return jsonify({"status": "success"})
     else:
         logging.warning(f"Received response for unknown session: {session_id}")
         return jsonify({"status": "error", "message": "Unknown session"}), 404
 
+@app.route("/api/agent-responses", methods=["POST"])
+def handle_agent_responses():
+    """Bulk variant of /api/agent-response: relays a batch of responses for one session in order."""
+    data = request.get_json()
+    session_id = data.get('session_id')
+    contents = data.get('contents')
+
+    if not session_id or not isinstance(contents, list):
+        return jsonify({"status": "error", "message": "Missing session_id or contents"}), 400
+
+    if session_id in user_agent_sessions:
+        logging.info(f"Relaying {len(contents)} agent responses to client {session_id}")
+        for content in contents:
+            if content:
+                relay_to_session(session_id, content)
+        return jsonify({"status": "success", "count": len(contents)})
+    else:
+        logging.warning(f"Received responses for unknown session: {session_id}")
+        return jsonify({"status": "error", "message": "Unknown session"}), 404
+
+@app.route("/api/metrics", methods=["GET"])
+def handle_metrics():
+    return jsonify(metrics.snapshot())
+
 if __name__ == "__main__":
-    logging.info("Starting Martian API with SocketIO support...")
-    socketio.run(app, port=5001, debug=True)
\ No newline at end of file
+    logging.info(f"Starting Martian API with SocketIO support ({socketio.async_mode} server) on {API_HOST}:{API_PORT}...")
+    if socketio.async_mode == "threading" and not API_DEBUG:
+        logging.warning("Neither eventlet nor gevent is installed; falling back to the Werkzeug development server")
+    socketio.run(app, host=API_HOST, port=API_PORT, debug=API_DEBUG, allow_unsafe_werkzeug=socketio.async_mode == "threading")
\ No newline at end of file
@@ -0,0 +1,82 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+
+import metrics
+from address_book import REPLICA_TTL, resolver
+
+# How long (in seconds) a replica that failed a delivery is skipped before being tried again
+REPLICA_EJECT_SECONDS = float(os.getenv("REPLICA_EJECT_SECONDS", str(REPLICA_TTL)))
+
+class ReplicaBalancer:
+    """
+    Client-side load balancing over the live replicas of a role in the address book.
+    Each request goes to the replica with the fewest requests outstanding from this
+    process. Replicas whose heartbeat has expired, or that recently failed a delivery,
+    are skipped.
+    """
+
+    def __init__(self, role: str, eject_seconds: float = REPLICA_EJECT_SECONDS):
+        self.role = role
+        self.eject_seconds = eject_seconds
+        self._outstanding: dict[str, int] = {}
+        self._ejected_until: dict[str, float] = {}
+
+        self._live = metrics.gauge(f"balancer.{role}.live_replicas")
+        self._in_flight = metrics.gauge(f"balancer.{role}.outstanding")
+        self._failures = metrics.counter(f"balancer.{role}.delivery_failures")
+
+    def _candidates(self) -> list[str]:
+        live = resolver.replicas(self.role)
+        self._live.set(len(live))
+        now = time.monotonic()
+        healthy = [address for address in live if self._ejected_until.get(address, 0) <= now]
+        return healthy or live # If every replica was ejected, try them anyway rather than fail outright
+
+    def pick(self, affinity: str | None = None) -> str | None:
+        """
+        Returns the replica to use, or None if the role has none. With an affinity key, the
+        same key maps to the same replica while it stays live (rendezvous hashing), for
+        requests that rely on that replica's local state.
+        """
+        candidates = self._candidates()
+        if not candidates:
+            return None
+        if affinity is not None:
+            return max(candidates, key=lambda address: hashlib.sha256(f"{affinity}:{address}".encode()).digest())
+        fewest = min(self._outstanding.get(address, 0) for address in candidates)
+        return random.choice([address for address in candidates if self._outstanding.get(address, 0) == fewest])
+
+    def report_failure(self, address: str):
+        """Skips a replica for a while after a failed delivery."""
+        self._failures.inc()
+        self._ejected_until[address] = time.monotonic() + self.eject_seconds
+
+    @asynccontextmanager
+    async def acquire(self, affinity: str | None = None, timeout: float = 5.0):
+        """
+        Picks a replica and counts a request outstanding against it for the duration of the
+        block. Waits up to `timeout` for a replica to register; yields None if none does.
+        """
+        address = self.pick(affinity)
+        if address is None:
+            deadline = time.monotonic() + timeout
+            while address is None and time.monotonic() < deadline:
+                await asyncio.sleep(min(resolver.poll_interval, max(deadline - time.monotonic(), 0)))
+                address = self.pick(affinity)
+        if address is None:
+            yield None
+            return
+
+        self._outstanding[address] = self._outstanding.get(address, 0) + 1
+        self._in_flight.inc()
+        try:
+            yield address
+        finally:
+            self._outstanding[address] -= 1
+            if not self._outstanding[address]:
+                del self._outstanding[address]
+            self._in_flight.dec()
@@ -0,0 +1,91 @@
+"""
+Benchmarks the fast-path strategy classifier against a labeled query set.
+
+Reports the classifier's own latency, how many queries it answers without the
+LLM at the configured threshold, how often those answers match the label, and
+the LLM time that would be saved at a given per-call LLM latency.
+
+    python bench_classifier.py --llm-latency 4.0 --threshold 0.8
+"""
+import argparse
+import json
+import time
+
+import strategy_classifier
+from strategy_classifier import HIGH_RISK_DEGEN, LOW_RISK_STAKING, MEDIUM_RISK_LP, classify_query
+
+# (query, expected strategy). None means there is no clear-cut answer and the LLM should decide.
+LABELED_QUERIES = [
+    ("I want low-risk staking with Marinade", LOW_RISK_STAKING),
+    ("What's the safest way to earn yield on my SOL?", LOW_RISK_STAKING),
+    ("Stake my SOL with Jito please", LOW_RISK_STAKING),
+    ("I'm a beginner, something conservative", LOW_RISK_STAKING),
+    ("liquid staking for passive income", LOW_RISK_STAKING),
+    ("I don't want to lose money, minimal risk only", LOW_RISK_STAKING),
+    ("Provide liquidity for USDC-USDT", MEDIUM_RISK_LP),
+    ("moderate risk, earn trading fees on a DEX", MEDIUM_RISK_LP),
+    ("balanced stablecoin strategy on Orca", MEDIUM_RISK_LP),
+    ("LP my stablecoins", MEDIUM_RISK_LP),
+    ("medium risk yield on USDC", MEDIUM_RISK_LP),
+    ("I want to go full degen with meme coins", HIGH_RISK_DEGEN),
+    ("max yield, I don't care about risk", HIGH_RISK_DEGEN),
+    ("aggressive farming on BONK pairs", HIGH_RISK_DEGEN),
+    ("looking for a 100x moonshot", HIGH_RISK_DEGEN),
+    ("highest APY possible, yolo", HIGH_RISK_DEGEN),
+    ("WIF farming", HIGH_RISK_DEGEN),
+    ("What should I do with my money?", None),
+    ("I have 10 SOL, any ideas?", None),
+    ("high yield but safe staking", None),
+    ("what's the best strategy right now", None),
+    ("compare Kamino and Drift", None),
+    # Held out: not used when tuning the rules
+    ("Should I avoid meme coins?", None),
+    ("what is a liquidity pool", None),
+    ("Is staking risky?", None),
+    ("I don't want to stake, go degen with meme coins", None),
+    ("no meme coins, something safe please", None),
+]
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+def run(iterations: int, llm_latency: float) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        for query, _ in LABELED_QUERIES:
+            start_time = time.perf_counter()
+            classify_query(query)
+            latencies.append(time.perf_counter() - start_time)
+
+    answered = correct = 0
+    for query, expected in LABELED_QUERIES:
+        classification = classify_query(query)
+        if classification.confident:
+            answered += 1
+            correct += classification.strategy == expected
+
+    total = len(LABELED_QUERIES)
+    return {
+        "queries": total,
+        "threshold": strategy_classifier.STRATEGY_CLASSIFIER_THRESHOLD,
+        "classifier_latency_us": {
+            "p50": round(percentile(latencies, 0.50) * 1e6, 2),
+            "p99": round(percentile(latencies, 0.99) * 1e6, 2),
+        },
+        "answered_without_llm": answered,
+        "llm_calls_avoided_pct": round(100 * answered / total, 1),
+        "fast_path_accuracy_pct": round(100 * correct / answered, 1) if answered else None,
+        "assumed_llm_latency_s": llm_latency,
+        "mean_latency_saved_per_query_s": round(llm_latency * answered / total, 3),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000, help="Times to classify the query set when timing")
+    parser.add_argument("--llm-latency", type=float, default=4.0, help="Assumed seconds per Gemini call")
+    parser.add_argument("--threshold", type=float, default=strategy_classifier.STRATEGY_CLASSIFIER_THRESHOLD)
+    args = parser.parse_args()
+
+    strategy_classifier.STRATEGY_CLASSIFIER_THRESHOLD = args.threshold
+    print(json.dumps(run(args.iterations, args.llm_latency), indent=2))
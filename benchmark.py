@@ -0,0 +1,315 @@
+"""
+End-to-end benchmark of the chat -> execute -> submit_signed_tx flow, runnable offline.
+
+Starts the fake Gemini and onchain services (fake_services.py), every agent and the
+API, then drives concurrent Socket.IO clients through the flow and reports throughput
+and p50/p95/p99 latency per stage. Save a run with --output and compare a later run
+against it with --baseline.
+
+    python benchmark.py --clients 20 --flows 5 --output baseline.json
+    python benchmark.py --clients 20 --flows 5 --baseline baseline.json
+    python benchmark.py --layout both    # separate agent processes vs. one bureau (bureau.py)
+    python benchmark.py --clients 20 --flows 1 --same-query    # identical queries share one LLM run
+
+Environment variables are passed through to the agents, e.g. STRATEGY_CACHE_TTL=0,
+STRATEGY_CLASSIFIER_MODE=off or SPECULATIVE_PREBUILD=1. Agent logs are written to bench_logs/.
+
+Uses the agents' fixed ports (8001-8005, API on 5001), so stop a running dev stack first.
+Needs the Socket.IO asyncio client: pip install "python-socketio[asyncio_client]"
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import socketio
+
+from fake_services import FakeServices, add_config_arguments, config_from_args, sign_fake_transaction
+
+API_URL = "http://127.0.0.1:5001"
+LOG_DIR = "bench_logs"
+
+# (script, port) per layout, in start order: agent.py and api.py look up the others' addresses at import time
+LAYOUTS = {
+    "processes": [
+        ("scout_agent.py", 8004),
+        ("risk_agent.py", 8005),
+        ("execution_agent.py", 8003),
+        ("strategy_agent.py", 8002),
+        ("agent.py", 8001),
+        ("api.py", 5001),
+    ],
+    "bureau": [
+        ("bureau.py", 8001),
+        ("api.py", 5001),
+    ],
+}
+
+# A mix of queries the keyword classifier answers locally and ones that go to the LLM
+QUERIES = [
+    "What should I do with my money?",
+    "I have 10 SOL, any ideas?",
+    "Stake my SOL with Jito please",
+    "what's the best strategy right now",
+    "Provide liquidity for USDC-USDT",
+    "compare Kamino and Drift",
+]
+
+STAGES = ["first_chunk", "chat", "execute", "submit", "flow"]
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+def wait_for_port(port: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def start_processes(scripts: list[tuple[str, int]], env: dict, startup_timeout: float, log_dir: str) -> list[subprocess.Popen]:
+    os.makedirs(log_dir, exist_ok=True)
+    processes = []
+    for script, port in scripts:
+        log = open(os.path.join(log_dir, script.replace(".py", ".log")), "w")
+        processes.append(subprocess.Popen([sys.executable, script], env=env, stdout=log, stderr=subprocess.STDOUT))
+        if not wait_for_port(port, startup_timeout):
+            stop_processes(processes)
+            raise RuntimeError(f"{script} did not start listening on port {port}; see {log_dir}/")
+    return processes
+
+def stop_processes(processes: list[subprocess.Popen]):
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+class StageError(Exception):
+    def __init__(self, stage: str, response):
+        super().__init__(f"{stage} failed: {response}")
+        self.stage = stage
+
+class BenchClient:
+    """One simulated browser session running the flow `flows` times in a row."""
+
+    def __init__(self, index: int, timeout: float, query: str | None = None):
+        self.index = index
+        self.timeout = timeout
+        self.query = query # Send this query in every flow instead of cycling through QUERIES
+        self.responses: asyncio.Queue = asyncio.Queue()
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("agent_response", self._on_response)
+        self.sio.on("overloaded", self._on_overloaded)
+
+    async def _on_response(self, data):
+        await self.responses.put(data.get("response"))
+
+    async def _on_overloaded(self, data):
+        await self.responses.put("overloaded")
+
+    @property
+    def fee_payer(self) -> str:
+        return f"BenchWallet{self.index}"
+
+    async def send(self, message):
+        await self.sio.emit("chat_message", {
+            "message": message if isinstance(message, str) else json.dumps(message),
+            "feePayer": self.fee_payer,
+        })
+
+    async def wait_for(self, response_type: str | None, on_chunk=None):
+        """
+        Waits for a response of `response_type`. Plain-text responses end a stage (they are
+        final results or errors) and are returned as is; status updates are skipped.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            response = await asyncio.wait_for(self.responses.get(), timeout=max(deadline - time.monotonic(), 0))
+            if isinstance(response, str):
+                return response
+            if isinstance(response, dict):
+                if response.get("type") == response_type:
+                    return response
+                if response.get("type") == "strategy_chunk" and on_chunk:
+                    on_chunk()
+
+    async def run_flow(self, query: str, results: dict):
+        flow_start = time.perf_counter()
+
+        # 1. Chat query -> strategy proposal
+        first_chunk = []
+        start_time = time.perf_counter()
+        await self.send(query)
+        proposal = await self.wait_for(
+            "strategy_proposal",
+            on_chunk=lambda: first_chunk or first_chunk.append(time.perf_counter() - start_time),
+        )
+        if not isinstance(proposal, dict):
+            raise StageError("chat", proposal)
+        results["chat"].append(time.perf_counter() - start_time)
+        results["first_chunk"].extend(first_chunk)
+
+        # 2. Execute -> unsigned transaction
+        start_time = time.perf_counter()
+        await self.send({"command": "execute", "payload": {
+            "strategy_id": proposal["strategy_id"],
+            "strategy_description": proposal["description"],
+            "feePayer": self.fee_payer,
+        }})
+        unsigned = await self.wait_for("unsigned_transaction_proposal")
+        if not isinstance(unsigned, dict):
+            raise StageError("execute", unsigned)
+        results["execute"].append(time.perf_counter() - start_time)
+
+        # 3. Sign and submit -> transaction hash
+        signed_tx = sign_fake_transaction(base64.b64decode(unsigned["unsigned_tx_b64"]))
+        start_time = time.perf_counter()
+        await self.send({"command": "submit_signed_tx", "payload": {
+            "signed_tx_b64": base64.b64encode(signed_tx).decode(),
+            "strategy_id": proposal["strategy_id"],
+        }})
+        submitted = await self.wait_for(None) # The result is a plain-text message
+        if not (isinstance(submitted, str) and "successfully" in submitted):
+            raise StageError("submit", submitted)
+        results["submit"].append(time.perf_counter() - start_time)
+
+        results["flow"].append(time.perf_counter() - flow_start)
+
+    async def run(self, flows: int, results: dict, errors: dict):
+        await self.sio.connect(API_URL)
+        try:
+            for flow in range(flows):
+                query = self.query or QUERIES[(self.index + flow) % len(QUERIES)]
+                try:
+                    await self.run_flow(query, results)
+                except StageError as e:
+                    errors[e.stage] = errors.get(e.stage, 0) + 1
+                except asyncio.TimeoutError:
+                    errors["timeout"] = errors.get("timeout", 0) + 1
+                    self.responses = asyncio.Queue() # Drop late replies from the timed-out flow
+        finally:
+            await self.sio.disconnect()
+
+async def run_clients(clients: int, flows: int, timeout: float, query: str | None = None) -> dict:
+    results = {stage: [] for stage in STAGES}
+    errors: dict[str, int] = {}
+    start_time = time.perf_counter()
+    await asyncio.gather(*(BenchClient(index, timeout, query).run(flows, results, errors) for index in range(clients)))
+    elapsed = time.perf_counter() - start_time
+
+    summary = {
+        "completed_flows": len(results["flow"]),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_flows_per_s": round(len(results["flow"]) / elapsed, 3),
+        "stages": {},
+    }
+    for stage, samples in results.items():
+        if samples:
+            summary["stages"][stage] = {
+                "count": len(samples),
+                "p50": round(percentile(samples, 0.50), 4),
+                "p95": round(percentile(samples, 0.95), 4),
+                "p99": round(percentile(samples, 0.99), 4),
+                "max": round(max(samples), 4),
+            }
+    return summary
+
+def print_summary(summary: dict, baseline: dict | None = None):
+    print(f"\nCompleted flows: {summary['completed_flows']} in {summary['elapsed_s']}s "
+          f"({summary['throughput_flows_per_s']} flows/s), errors: {summary['errors'] or 'none'}")
+    if baseline:
+        print(f"Baseline:        {baseline['completed_flows']} in {baseline['elapsed_s']}s "
+              f"({baseline['throughput_flows_per_s']} flows/s)")
+
+    print(f"\n{'stage':<12} {'count':>6} {'p50 s':>9} {'p95 s':>9} {'p99 s':>9} {'max s':>9}")
+    for stage in STAGES:
+        stats = summary["stages"].get(stage)
+        if not stats:
+            continue
+        print(f"{stage:<12} {stats['count']:>6} {stats['p50']:>9.3f} {stats['p95']:>9.3f} {stats['p99']:>9.3f} {stats['max']:>9.3f}")
+        base = (baseline or {}).get("stages", {}).get(stage)
+        if base:
+            changes = [
+                f"{(stats[p] - base[p]) / base[p] * 100:+8.1f}%" if base[p] else f"{'n/a':>9}"
+                for p in ("p50", "p95", "p99", "max")
+            ]
+            print(f"{'  vs base':<12} {'':>6} {' '.join(changes)}")
+
+def run_layout(layout: str, services: FakeServices, env: dict, args) -> dict:
+    calls_before = dict(services.stats)
+    processes = start_processes(LAYOUTS[layout], env, args.startup_timeout, os.path.join(LOG_DIR, layout))
+    try:
+        summary = asyncio.run(run_clients(args.clients, args.flows, args.timeout, QUERIES[0] if args.same_query else None))
+    finally:
+        stop_processes(processes)
+
+    summary["config"] = {"layout": layout, "clients": args.clients, "flows": args.flows, "same_query": args.same_query, "fake_services": vars(services.config)}
+    summary["upstream_calls"] = {name: count - calls_before.get(name, 0) for name, count in services.stats.items()}
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the full agent pipeline against local fake services.")
+    parser.add_argument("--clients", type=int, default=10, help="Concurrent Socket.IO clients")
+    parser.add_argument("--flows", type=int, default=3, help="chat -> execute -> submit flows per client")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-stage timeout in seconds")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--layout", choices=[*LAYOUTS, "both"], default="processes",
+                        help="Run the agents as separate processes, in one bureau, or both and compare them")
+    parser.add_argument("--same-query", action="store_true",
+                        help="Every client sends the same LLM-bound query at once; with coalescing the fake Gemini sees about one call per wave")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results previously written with --output")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    if args.layout == "both" and args.baseline:
+        parser.error("--baseline compares a single layout; --layout both compares the layouts with each other")
+
+    services = FakeServices(config_from_args(args))
+    services.start()
+
+    env = {
+        **os.environ,
+        "PYTHONUNBUFFERED": "1",
+        "GEMINI_API_ENDPOINT": services.gemini_url,
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "benchmark"),
+        "ONCHAIN_SERVICE_URL": services.onchain_url,
+    }
+    try:
+        layouts = list(LAYOUTS) if args.layout == "both" else [args.layout]
+        summaries = {layout: run_layout(layout, services, env, args) for layout in layouts}
+    finally:
+        services.stop()
+
+    if args.layout == "both":
+        for layout, summary in summaries.items():
+            print(f"\n=== {layout} ===")
+            print_summary(summary)
+        print("\n=== bureau vs processes ===")
+        print_summary(summaries["bureau"], summaries["processes"])
+        results = summaries
+    else:
+        results = summaries[args.layout]
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+        print_summary(results, baseline)
+        print(f"\nUpstream calls: {results['upstream_calls']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,50 @@
+"""
+Runs every agent in this one process under a uagents Bureau.
+
+Messages between the agents are delivered in memory instead of as signed HTTP
+envelopes between five processes, and each role resolves to its in-process agent
+without going through addresses.json. The Bureau listens on the user agent's port
+(8001), so the API reaches it exactly as in the multi-process layout.
+
+    python bureau.py
+    python api.py
+"""
+import os
+
+from uagents import Bureau
+
+from address_book import register_local_address, save_addresses
+
+BUREAU_PORT = int(os.getenv("BUREAU_PORT", "8001"))
+
+# Agents are imported in dependency order: agent.py resolves the Strategy and
+# Execution agents' addresses when it is imported.
+from scout_agent import scout_agent
+from risk_agent import risk_agent
+from execution_agent import execution_agent
+from strategy_agent import strategy_agent
+
+ROLES = {
+    "scout_agent": scout_agent,
+    "risk_agent": risk_agent,
+    "execution_agent": execution_agent,
+    "strategy_agent": strategy_agent,
+}
+for role, role_agent in ROLES.items():
+    register_local_address(role, role_agent.address)
+
+from agent import agent as user_agent
+
+ROLES["user_agent"] = user_agent
+register_local_address("user_agent", user_agent.address)
+
+bureau = Bureau(port=BUREAU_PORT, endpoint=[f"http://127.0.0.1:{BUREAU_PORT}/submit"])
+for role_agent in ROLES.values():
+    bureau.add(role_agent)
+
+if __name__ == "__main__":
+    # The API runs in its own process and still finds the user agent through the address file
+    save_addresses({role: role_agent.address for role, role_agent in ROLES.items()})
+    for role, role_agent in ROLES.items():
+        print(f"{role} running in the bureau with address: {role_agent.address}")
+    bureau.run()
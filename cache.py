@@ -0,0 +1,182 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import metrics
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one execution.
+    Callers that arrive while a call for their key is running await the same
+    task instead of starting their own.
+    """
+
+    def __init__(self, name: str):
+        self._in_flight: dict[object, asyncio.Task] = {}
+        self._leaders = metrics.counter(f"{name}.singleflight.leaders")
+        self._joined = metrics.counter(f"{name}.singleflight.joined")
+
+    def in_flight(self, key) -> bool:
+        return key in self._in_flight
+
+    async def do(self, key, factory):
+        """Runs factory() for key unless a call for key is already running, and returns its result."""
+        task = self._in_flight.get(key)
+        if task is None:
+            self._leaders.inc()
+            task = asyncio.create_task(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self._joined.inc()
+        # Shield so one caller being cancelled doesn't cancel the work the others are waiting on
+        return await asyncio.shield(task)
+
+class SnapshotCache:
+    """
+    Holds a single value produced by an async loader, with stale-while-revalidate.
+    Younger than `ttl`: served as-is. Younger than `ttl + max_stale`: served while
+    one background task refreshes it. Older, or never loaded: callers wait for a
+    load, and concurrent waiters share that load.
+    """
+
+    def __init__(self, name: str, loader, ttl: float, max_stale: float):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._value = None
+        self._loaded_at: float | None = None
+        self._flight = SingleFlight(name)
+        self._refresh_task: asyncio.Task | None = None # Referenced so it isn't garbage-collected mid-refresh
+
+        self._hits = metrics.counter(f"{name}.hits")
+        self._stale_hits = metrics.counter(f"{name}.stale_hits")
+        self._misses = metrics.counter(f"{name}.misses")
+        self._refresh_failures = metrics.counter(f"{name}.refresh_failures")
+
+    def age(self) -> float | None:
+        """Seconds since the cached value was loaded, or None if nothing is cached."""
+        if self._loaded_at is None:
+            return None
+        return time.monotonic() - self._loaded_at
+
+    async def get(self):
+        """Returns (value, age_in_seconds), loading the value first if needed."""
+        age = self.age()
+        if age is not None and age < self.ttl:
+            self._hits.inc()
+            return self._value, age
+        if age is not None and age < self.ttl + self.max_stale:
+            self._stale_hits.inc()
+            if not self._flight.in_flight(None):
+                self._refresh_task = asyncio.create_task(self._background_refresh())
+            return self._value, age
+
+        self._misses.inc()
+        await self._flight.do(None, self._load)
+        return self._value, self.age()
+
+    async def _load(self):
+        value = await self.loader()
+        self._value = value
+        self._loaded_at = time.monotonic()
+        return value
+
+    async def _background_refresh(self):
+        try:
+            await self._flight.do(None, self._load)
+        except Exception:
+            self._refresh_failures.inc() # Keep serving the stale value until a refresh succeeds
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after `ttl` seconds.
+    The least recently used entries are evicted once the cache holds more than
+    `max_entries` items or more than `max_bytes` of (caller-estimated) values.
+    If given, on_discard(key, value) is called for every entry that is evicted or
+    expires, i.e. that leaves the cache without being popped.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int, max_bytes: int | None = None, on_discard=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_discard = on_discard
+        self._entries: OrderedDict[object, tuple[float, int, object]] = OrderedDict()
+        self._bytes = 0
+
+        self._hits = metrics.counter(f"{name}.hits")
+        self._misses = metrics.counter(f"{name}.misses")
+        self._evictions = metrics.counter(f"{name}.evictions")
+        self._expirations = metrics.counter(f"{name}.expirations")
+        self._size = metrics.gauge(f"{name}.entries")
+        self._size_bytes = metrics.gauge(f"{name}.bytes")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the cached value for key, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses.inc()
+            return None
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self._discard(key)
+            self._expirations.inc()
+            self._misses.inc()
+            return None
+        self._entries.move_to_end(key)
+        self._hits.inc()
+        return value
+
+    def put(self, key, value, size: int = 0, ttl: float | None = None):
+        """Stores value under key. `size` is the value's approximate size in bytes."""
+        if key in self._entries:
+            self._remove(key)
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self._bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            self._discard(next(iter(self._entries)))
+            self._evictions.inc()
+        self._publish_size()
+
+    def pop(self, key):
+        """Removes key and returns its value if it was present and not expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._discard(key) # Expired before it was popped: counted like any other expiry
+            self._expirations.inc()
+            return None
+        return self._remove(key)
+
+    def purge_expired(self) -> int:
+        """Removes every expired entry now rather than when it is next looked up. Returns how many were removed."""
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            self._discard(key)
+            self._expirations.inc()
+        return len(expired)
+
+    def _remove(self, key):
+        _, size, value = self._entries.pop(key)
+        self._bytes -= size
+        self._publish_size()
+        return value
+
+    def _discard(self, key):
+        value = self._remove(key)
+        if self.on_discard is not None:
+            self.on_discard(key, value)
+
+    def _publish_size(self):
+        self._size.set(len(self._entries))
+        self._size_bytes.set(self._bytes)
@@ -0,0 +1,51 @@
+"""
+Absolute request deadlines shared across the agent pipeline.
+
+The API stamps each user request with a deadline (Unix time) and every hop passes
+it on unchanged. Each agent derives its own timeouts from the time that is left,
+instead of using fixed per-hop timeouts, and drops work whose deadline has passed.
+"""
+import os
+import time
+
+import metrics
+
+# --- Request Budget Configuration ---
+# End-to-end budget the API gives a chat query, and an execute or submit command
+CHAT_REQUEST_BUDGET = float(os.getenv("CHAT_REQUEST_BUDGET", "240"))
+COMMAND_REQUEST_BUDGET = float(os.getenv("COMMAND_REQUEST_BUDGET", "60"))
+# Each hop gives the next one a deadline this much earlier than its own, leaving time for the reply to travel back
+DEADLINE_REPLY_MARGIN = float(os.getenv("DEADLINE_REPLY_MARGIN", "0.5"))
+# ------------------------------------
+
+def deadline_after(seconds: float) -> float:
+    return time.time() + seconds
+
+def remaining(deadline: float | None) -> float | None:
+    """Seconds left until the deadline (negative once it has passed), or None without a deadline."""
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+def hop_timeout(deadline: float | None, default: float) -> float:
+    """Timeout for a call made on behalf of a request: what is left of its deadline, but never more than `default`."""
+    left = remaining(deadline)
+    if left is None:
+        return default
+    return max(min(left, default), 0.0)
+
+def forward(deadline: float | None) -> float | None:
+    """The deadline to give the next hop, early enough that its reply arrives before this hop's deadline."""
+    return None if deadline is None else deadline - DEADLINE_REPLY_MARGIN
+
+def expired(deadline: float | None) -> bool:
+    left = remaining(deadline)
+    return left is not None and left <= 0
+
+def drop_if_expired(ctx, name: str, deadline: float | None) -> bool:
+    """Returns True, and counts `<name>.deadline_expired`, if the request's deadline has already passed."""
+    if not expired(deadline):
+        return False
+    metrics.counter(f"{name}.deadline_expired").inc()
+    ctx.logger.warning(f"Dropping {name} work: its deadline passed {-remaining(deadline):.1f}s ago")
+    return True
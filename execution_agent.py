@@ -1,7 +1,16 @@
 from uagents import Agent, Context, Protocol
-from models import ExecuteStrategy, ExecutionResult, SubmitSignedTransaction
-from address_book import save_address
+from models import ExecuteStrategy, ExecutionResult, PrebuildTransaction, SubmitSignedTransaction
+from address_book import attach_replica
+from cache import SingleFlight, TTLCache
+from deadlines import drop_if_expired, hop_timeout
+from http_client import HttpClientPool
+from resilience import UpstreamUnavailableError, endpoint
+from scheduler import PriorityScheduler
+from solana_tx import transaction_signature
+import metrics
+import tracing
 
+import asyncio
 import os
 import httpx
 import base64
@@ -14,46 +23,177 @@ load_dotenv()
 ONCHAIN_SERVICE_URL = os.getenv("ONCHAIN_SERVICE_URL", "http://localhost:3001")
 # -------------------------------------
 
+# --- Replica Configuration ---
+# Run more replicas with distinct EXECUTION_AGENT_REPLICA (e.g. "2") and EXECUTION_AGENT_PORT values
+EXECUTION_AGENT_REPLICA = os.getenv("EXECUTION_AGENT_REPLICA", "")
+EXECUTION_AGENT_PORT = int(os.getenv("EXECUTION_AGENT_PORT", "8003"))
+# ------------------------------
+
 # The Execution Agent
 execution_agent = Agent(
     name="execution_agent",
-    port=8003,
-    seed="execution_agent_secret_seed_phrase",
-    endpoint=["http://127.0.0.1:8003/submit"],
+    port=EXECUTION_AGENT_PORT,
+    seed=f"execution_agent_secret_seed_phrase{EXECUTION_AGENT_REPLICA}",
+    endpoint=[f"http://127.0.0.1:{EXECUTION_AGENT_PORT}/submit"],
+    # Handle each message as its own task, so the priority scheduler has concurrent requests
+    # to order: one at a time, a submission would still wait behind a slow execute build
+    handle_messages_concurrently=True,
 )
+# Every running replica registers itself and keeps a heartbeat in the address book
+attach_replica(execution_agent, "execution_agent")
+
+http_pool = HttpClientPool("execution_agent")
+http_pool.attach(execution_agent)
+metrics.attach(execution_agent)
+
+# Calls to the onchain service fail fast while it is failing or overloaded, instead of queuing
+build_endpoint = endpoint("onchain.build_gateway_transaction")
+send_endpoint = endpoint("onchain.send_signed_transaction")
+
+# Submissions go ahead of execute builds, which go ahead of speculative pre-builds
+scheduler = PriorityScheduler("execution_agent")
 
 # Define the protocol for execution
 execution_proto = Protocol("Execution", version="1.0")
 
+# --- Speculative Pre-build Configuration ---
+# A built transaction embeds a recent blockhash, which the network only accepts for about
+# 150 slots (~60s). Prebuilt transactions are dropped well before that so the user still
+# has time to sign.
+EXECUTION_PREBUILD_TTL = float(os.getenv("EXECUTION_PREBUILD_TTL", "40"))
+EXECUTION_PREBUILD_MAX_ENTRIES = int(os.getenv("EXECUTION_PREBUILD_MAX_ENTRIES", "1024"))
+# -------------------------------------------
+
+prebuild_started = metrics.counter("execution.prebuild.started")
+prebuild_failed = metrics.counter("execution.prebuild.failed")
+prebuild_hits = metrics.counter("execution.prebuild.hits")
+prebuild_misses = metrics.counter("execution.prebuild.misses")
+prebuild_wasted = metrics.counter("execution.prebuild.wasted")
+
+# Transactions built ahead of an execute, keyed by (strategy_id, feePayer). Ones that expire
+# or are evicted without being used were wasted builds.
+prebuilt_transactions = TTLCache(
+    "execution.prebuild.cache",
+    ttl=EXECUTION_PREBUILD_TTL,
+    max_entries=EXECUTION_PREBUILD_MAX_ENTRIES,
+    on_discard=lambda key, value: prebuild_wasted.inc(),
+)
+prebuild_flight = SingleFlight("execution.prebuild")
+# Keys whose execute has already arrived, so a pre-build still queued for a slot is skipped
+executed_keys = TTLCache("execution.prebuild.executed", ttl=EXECUTION_PREBUILD_TTL, max_entries=EXECUTION_PREBUILD_MAX_ENTRIES)
+# Pre-builds running in the background; the references keep their tasks from being garbage-collected
+prebuild_tasks: set[asyncio.Task] = set()
+
+# --- Submission Deduplication Configuration ---
+# How long a submitted transaction's result is remembered. Past its blockhash's ~60s
+# lifetime, a resend couldn't land anyway.
+SUBMIT_DEDUP_TTL = float(os.getenv("SUBMIT_DEDUP_TTL", "120"))
+SUBMIT_DEDUP_MAX_ENTRIES = int(os.getenv("SUBMIT_DEDUP_MAX_ENTRIES", "10000"))
+# ----------------------------------------------
+
+submit_dedup_cached = metrics.counter("execution.submit.dedup_cached")
+submit_dedup_joined = metrics.counter("execution.submit.dedup_joined")
+
+# Results of successful submissions, keyed by the transaction's first signature
+submitted_transactions = TTLCache("execution.submit.results", ttl=SUBMIT_DEDUP_TTL, max_entries=SUBMIT_DEDUP_MAX_ENTRIES)
+submit_flight = SingleFlight("execution.submit")
+
+@execution_agent.on_interval(period=EXECUTION_PREBUILD_TTL / 4)
+async def purge_expired_prebuilds(ctx: Context):
+    prebuilt_transactions.purge_expired()
+
+async def build_transaction(strategy_id: str, strategy: str, feePayer: str | None, deadline: float | None = None) -> str:
+    """
+    Calls the Node.js Onchain service to build and optimize the transaction. Returns it base64-encoded.
+    The call is limited to what is left of the request's deadline, if it has one.
+    """
+    gateway_service_payload = {
+        "strategyId": strategy_id,
+        "strategyDescription": strategy,
+        "feePayer": feePayer,
+    }
+
+    service_response = await build_endpoint.request(
+        http_pool,
+        "POST",
+        f"{ONCHAIN_SERVICE_URL}/build-gateway-transaction",
+        json=gateway_service_payload,
+        timeout=hop_timeout(deadline, 30.0)
+    )
+    service_response.raise_for_status() # Raise an exception for 4xx/5xx responses
+    service_data = service_response.json()
+
+    if service_data.get("error"):
+        raise Exception(f"Onchain service build error: {service_data['error']}")
+
+    return service_data.get("optimizedTxB64")
+
+async def prebuild_transaction(key: tuple, strategy: str) -> str:
+    optimized_tx_b64 = await build_transaction(key[0], strategy, key[1])
+    prebuilt_transactions.put(key, optimized_tx_b64, size=len(optimized_tx_b64 or ""))
+    return optimized_tx_b64
+
+async def take_prebuilt_transaction(ctx: Context, key: tuple, strategy: str) -> str | None:
+    """Returns the speculatively built transaction for key, waiting for it if the build is still running."""
+    optimized_tx_b64 = prebuilt_transactions.pop(key)
+    if optimized_tx_b64 is not None:
+        prebuild_hits.inc()
+        return optimized_tx_b64
+
+    if not prebuild_flight.in_flight(key):
+        prebuild_misses.inc()
+        return None
+    try:
+        optimized_tx_b64 = await prebuild_flight.do(key, lambda: prebuild_transaction(key, strategy))
+    except Exception as e:
+        ctx.logger.warning(f"Speculative build for strategy {key[0]} failed, building again: {e}")
+        prebuild_misses.inc()
+        return None
+    prebuilt_transactions.pop(key)
+    prebuild_hits.inc()
+    return optimized_tx_b64
+
+async def run_prebuild(ctx: Context, key: tuple, strategy: str):
+    async with scheduler.slot("prebuild"):
+        if executed_keys.get(key) is not None or prebuild_flight.in_flight(key) or prebuilt_transactions.get(key) is not None:
+            return
+        ctx.logger.info(f"Pre-building transaction for strategy {key[0]}")
+        prebuild_started.inc()
+        try:
+            await prebuild_flight.do(key, lambda: prebuild_transaction(key, strategy))
+        except Exception as e:
+            prebuild_failed.inc()
+            ctx.logger.warning(f"Speculative build for strategy {key[0]} failed: {e}")
+
+@execution_proto.on_message(model=PrebuildTransaction)
+@tracing.traced_handler("execution.handle_prebuild")
+async def handle_prebuild_transaction(ctx: Context, sender: str, msg: PrebuildTransaction):
+    """Starts the build in the background and returns, so an execute for it can join the running build."""
+    key = (msg.strategy_id, msg.feePayer)
+    if prebuild_flight.in_flight(key) or prebuilt_transactions.get(key) is not None:
+        return
+    task = asyncio.create_task(run_prebuild(ctx, key, msg.strategy))
+    prebuild_tasks.add(task)
+    task.add_done_callback(prebuild_tasks.discard)
+
 @execution_proto.on_message(model=ExecuteStrategy)
+@tracing.traced_handler("execution.handle_execute")
+@scheduler.prioritized("execute")
 async def handle_execute_strategy(ctx: Context, sender: str, msg: ExecuteStrategy):
     ctx.logger.info(f"Received strategy execution request from {sender}: {msg.strategy} (ID: {msg.strategy_id})")
+    if drop_if_expired(ctx, "execution.execute", msg.deadline):
+        return # The User Agent has stopped waiting for the result
 
     # In the future, this is where the Sanctum Gateway integration will go.
     # For now, we'll simulate a successful execution.
     ctx.logger.info("Executing real Sanctum Gateway integration...")
 
+    key = (msg.strategy_id, msg.feePayer)
+    executed_keys.put(key, True)
     try:
-        # Call the Node.js Onchain service to build and optimize the transaction
-        gateway_service_payload = {
-            "strategyId": msg.strategy_id,
-            "strategyDescription": msg.strategy,
-            "feePayer": msg.feePayer,
-        }
-        
-        async with httpx.AsyncClient() as client:
-            service_response = await client.post(
-                f"{ONCHAIN_SERVICE_URL}/build-gateway-transaction",
-                json=gateway_service_payload,
-                timeout=30.0
-            )
-            service_response.raise_for_status() # Raise an exception for 4xx/5xx responses
-            service_data = service_response.json()
-
-        if service_data.error:
-            raise Exception(f"Onchain service build error: {service_data.error}")
-
-        optimized_tx_b64 = service_data.optimizedTxB64
+        optimized_tx_b64 = await take_prebuilt_transaction(ctx, key, msg.strategy)
+        if optimized_tx_b64 is None:
+            optimized_tx_b64 = await build_transaction(msg.strategy_id, msg.strategy, msg.feePayer, msg.deadline)
         
         # Return the unsigned transaction to the User Agent
         await ctx.send(sender, ExecutionResult(
@@ -67,6 +207,12 @@ async def handle_execute_strategy(ctx: Context, sender: str, msg: ExecuteStrateg
             success=False,
             error=f"HTTP error during Onchain service build: {e.response.status_code} - {e.response.text}"
         ))
+    except UpstreamUnavailableError as e:
+        ctx.logger.warning(f"Onchain service build not attempted: {e}")
+        await ctx.send(sender, ExecutionResult(
+            success=False,
+            error="The onchain service is temporarily unavailable. Please try again shortly."
+        ))
     except httpx.RequestError as e:
         ctx.logger.error(f"Network error during Onchain service build: {e}")
         await ctx.send(sender, ExecutionResult(
@@ -80,10 +226,7 @@ async def handle_execute_strategy(ctx: Context, sender: str, msg: ExecuteStrateg
             error=f"Error during Onchain service build: {e}"
         ))
 
-@execution_proto.on_message(model=SubmitSignedTransaction)
-async def handle_submit_signed_transaction(ctx: Context, sender: str, msg: SubmitSignedTransaction):
-    ctx.logger.info(f"Received signed transaction for submission (ID: {msg.strategy_id})")
-
+async def send_signed_transaction(ctx: Context, msg: SubmitSignedTransaction) -> ExecutionResult:
     try:
         # Call the Node.js Onchain service to send the signed transaction
         gateway_service_payload = {
@@ -91,48 +234,84 @@ async def handle_submit_signed_transaction(ctx: Context, sender: str, msg: Submi
             "strategyId": msg.strategy_id,
         }
 
-        async with httpx.AsyncClient() as client:
-            service_response = await client.post(
-                f"{ONCHAIN_SERVICE_URL}/send-signed-transaction",
-                json=gateway_service_payload,
-                timeout=30.0
-            )
-            service_response.raise_for_status() # Raise an exception for 4xx/5xx responses
-            service_data = service_response.json()
+        service_response = await send_endpoint.request(
+            http_pool,
+            "POST",
+            f"{ONCHAIN_SERVICE_URL}/send-signed-transaction",
+            json=gateway_service_payload,
+            timeout=hop_timeout(msg.deadline, 30.0)
+        )
+        service_response.raise_for_status() # Raise an exception for 4xx/5xx responses
+        service_data = service_response.json()
 
-        if service_data.error:
-            raise Exception(f"Onchain service send error: {service_data.error}")
+        if service_data.get("error"):
+            raise Exception(f"Onchain service send error: {service_data['error']}")
 
-        transaction_hash = service_data.transactionHash
+        transaction_hash = service_data.get("transactionHash")
 
-        await ctx.send(sender, ExecutionResult(
+        return ExecutionResult(
             success=True,
             transaction_hash=transaction_hash
-        ))
+        )
 
     except httpx.HTTPStatusError as e:
         ctx.logger.error(f"HTTP error during Onchain service send: {e.response.status_code} - {e.response.text}")
-        await ctx.send(sender, ExecutionResult(
+        return ExecutionResult(
             success=False,
             error=f"HTTP error during Onchain service send: {e.response.status_code} - {e.response.text}"
-        ))
+        )
+    except UpstreamUnavailableError as e:
+        ctx.logger.warning(f"Onchain service send not attempted: {e}")
+        return ExecutionResult(
+            success=False,
+            error="The onchain service is temporarily unavailable. Please try again shortly."
+        )
     except httpx.RequestError as e:
         ctx.logger.error(f"Network error during Onchain service send: {e}")
-        await ctx.send(sender, ExecutionResult(
+        return ExecutionResult(
             success=False,
             error=f"Network error during Onchain service send: {e}"
-        ))
+        )
     except Exception as e:
         ctx.logger.error(f"Error during Onchain service send: {e}")
-        await ctx.send(sender, ExecutionResult(
+        return ExecutionResult(
             success=False,
             error=f"Error during Onchain service send: {e}"
-        ))
+        )
+
+async def submit_once(ctx: Context, signature: str, msg: SubmitSignedTransaction) -> ExecutionResult:
+    result = await send_signed_transaction(ctx, msg)
+    # Only successes are remembered; a failed send may succeed if the user retries
+    if result.success:
+        submitted_transactions.put(signature, result)
+    return result
+
+@execution_proto.on_message(model=SubmitSignedTransaction)
+@tracing.traced_handler("execution.handle_submit")
+@scheduler.prioritized("submit")
+async def handle_submit_signed_transaction(ctx: Context, sender: str, msg: SubmitSignedTransaction):
+    ctx.logger.info(f"Received signed transaction for submission (ID: {msg.strategy_id})")
+    if drop_if_expired(ctx, "execution.submit", msg.deadline):
+        return # Not sent: the user is told the submission timed out and can retry it
+
+    # The same signed transaction always carries the same signature, so it identifies retries
+    signature = transaction_signature(msg.signed_tx_b64)
+    if signature is None:
+        result = await send_signed_transaction(ctx, msg)
+    elif (result := submitted_transactions.get(signature)) is not None:
+        submit_dedup_cached.inc()
+        ctx.logger.info(f"Transaction {signature} was already submitted, returning the earlier result")
+    else:
+        if submit_flight.in_flight(signature):
+            submit_dedup_joined.inc()
+            ctx.logger.info(f"Transaction {signature} is already being submitted, waiting for that send")
+        result = await submit_flight.do(signature, lambda: submit_once(ctx, signature, msg))
+
+    await ctx.send(sender, result)
 
 # Include the protocol
 execution_agent.include(execution_proto)
 
 if __name__ == "__main__":
-    save_address("execution_agent", execution_agent.address)
     print(f"Execution Agent running with address: {execution_agent.address}")
     execution_agent.run()
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+Local stand-ins for the external services the agents depend on, so the whole
+pipeline can run offline (see benchmark.py):
+
+- Gemini: the REST generateContent and streamGenerateContent (?alt=sse) endpoints.
+  Point the Strategy Agent at it with GEMINI_API_ENDPOINT.
+- Onchain service: /market-data, /build-gateway-transaction and
+  /send-signed-transaction. Point the agents at it with ONCHAIN_SERVICE_URL.
+
+Latencies are configurable and jittered. Request counts are served at /stats.
+
+    python fake_services.py --gemini-latency 2.0 --build-latency 0.3
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+
+from solana_tx import transaction_signature
+from strategy_classifier import MEDIUM_RISK_LP, STRATEGY_TEMPLATES, classify_query
+
+GEMINI_PORT = 8090
+ONCHAIN_PORT = 3101
+
+@dataclass
+class FakeServiceConfig:
+    gemini_latency: float = 2.0 # Seconds until the first chunk
+    gemini_chunk_delay: float = 0.05 # Seconds between streamed chunks
+    gemini_chunks: int = 8
+    market_data_latency: float = 0.05
+    build_latency: float = 0.3
+    send_latency: float = 0.5
+    jitter: float = 0.2 # Each latency is scaled by a random factor in [1 - jitter, 1 + jitter]
+    failure_rate: float = 0.0 # Fraction of onchain requests answered with a 500
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+def fake_unsigned_transaction(strategy_id: str) -> bytes:
+    """A transaction shaped like Solana's wire format: one zeroed signature slot, then the message."""
+    message = os.urandom(32) + strategy_id.encode()
+    return bytes([1]) + bytes(64) + message
+
+def sign_fake_transaction(unsigned_tx: bytes) -> bytes:
+    """What the wallet does in the benchmark: fills the signature slot."""
+    return unsigned_tx[:1] + os.urandom(64) + unsigned_tx[65:]
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real services
+    config: FakeServiceConfig
+    stats: Counter
+    stats_lock: threading.Lock
+
+    def log_message(self, format, *args):
+        pass
+
+    def count(self, name: str):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, payload, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.stats_lock:
+                self.send_json(dict(self.stats))
+        else:
+            self.handle_get()
+
+    def handle_get(self):
+        self.send_json({"error": f"Unknown path {self.path}"}, 404)
+
+class GeminiHandler(_JsonHandler):
+    """Answers every prompt with the strategy template matching its user query."""
+
+    def do_POST(self):
+        body = self.read_json()
+        prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+        text = self.proposal_text(prompt)
+
+        if ":streamGenerateContent" in self.path:
+            self.count("streamGenerateContent")
+            self.stream(text)
+        elif ":generateContent" in self.path:
+            self.count("generateContent")
+            self.config.sleep(self.config.gemini_latency + self.config.gemini_chunk_delay * (self.config.gemini_chunks - 1))
+            self.send_json(self.candidate(text))
+        else:
+            self.send_json({"error": f"Unknown path {self.path}"}, 404)
+
+    @staticmethod
+    def proposal_text(prompt: str) -> str:
+        match = re.search(r'User Query: "(.*)"', prompt)
+        classification = classify_query(match.group(1)) if match else None
+        title = classification.strategy if classification and classification.strategy else MEDIUM_RISK_LP
+        proposal = {"type": "strategy_proposal", "title": title, **STRATEGY_TEMPLATES[title], "strategy_id": str(uuid4())}
+        return f"```json\n{json.dumps(proposal, indent=2)}\n```"
+
+    @staticmethod
+    def candidate(text: str) -> dict:
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}]}
+
+    def stream(self, text: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunks = max(self.config.gemini_chunks, 1)
+        size = -(-len(text) // chunks)
+        self.config.sleep(self.config.gemini_latency)
+        for index in range(0, len(text), size):
+            if index:
+                self.config.sleep(self.config.gemini_chunk_delay)
+            event = f"data: {json.dumps(self.candidate(text[index:index + size]))}\r\n\r\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+class OnchainHandler(_JsonHandler):
+    """The Node onchain service's endpoints, returning transactions in Solana's wire layout."""
+
+    def fail(self) -> bool:
+        if random.random() < self.config.failure_rate:
+            self.count("injected_failures")
+            self.send_json({"error": "Injected failure"}, 500)
+            return True
+        return False
+
+    def handle_get(self):
+        if self.path != "/market-data":
+            return super().handle_get()
+        self.count("market-data")
+        self.config.sleep(self.config.market_data_latency)
+        if not self.fail():
+            self.send_json({"Kamino USDC": f"{random.uniform(10, 14):.1f}%", "Marinade SOL": f"{random.uniform(6, 8):.1f}%"})
+
+    def do_POST(self):
+        body = self.read_json()
+        if self.path == "/build-gateway-transaction":
+            self.count("build-gateway-transaction")
+            self.config.sleep(self.config.build_latency)
+            if not self.fail():
+                tx = fake_unsigned_transaction(str(body.get("strategyId")))
+                self.send_json({"optimizedTxB64": base64.b64encode(tx).decode()})
+        elif self.path == "/send-signed-transaction":
+            self.count("send-signed-transaction")
+            self.config.sleep(self.config.send_latency)
+            if self.fail():
+                return
+            signature = transaction_signature(body.get("signedTxB64") or "")
+            if signature is None:
+                self.send_json({"error": "Transaction is not signed"}, 400)
+            else:
+                self.send_json({"transactionHash": signature})
+        else:
+            self.send_json({"error": f"Unknown path {self.path}"}, 404)
+
+class FakeServices:
+    """Runs the fake Gemini and onchain servers on background threads."""
+
+    def __init__(self, config: FakeServiceConfig, gemini_port: int = GEMINI_PORT, onchain_port: int = ONCHAIN_PORT, host: str = "127.0.0.1"):
+        self.config = config
+        self.stats = Counter()
+        shared = {"config": config, "stats": self.stats, "stats_lock": threading.Lock()}
+        self.servers = [
+            ThreadingHTTPServer((host, gemini_port), type("Gemini", (GeminiHandler,), shared)),
+            ThreadingHTTPServer((host, onchain_port), type("Onchain", (OnchainHandler,), shared)),
+        ]
+        for server in self.servers:
+            server.daemon_threads = True
+        self.gemini_url = f"http://{host}:{gemini_port}"
+        self.onchain_url = f"http://{host}:{onchain_port}"
+
+    def start(self):
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    defaults = FakeServiceConfig()
+    for name, value in vars(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+
+def config_from_args(args: argparse.Namespace) -> FakeServiceConfig:
+    return FakeServiceConfig(**{name: getattr(args, name) for name in vars(FakeServiceConfig())})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local stand-ins for Gemini and the onchain service.")
+    parser.add_argument("--gemini-port", type=int, default=GEMINI_PORT)
+    parser.add_argument("--onchain-port", type=int, default=ONCHAIN_PORT)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    services = FakeServices(config_from_args(args), args.gemini_port, args.onchain_port)
+    services.start()
+    print(f"Fake Gemini at {services.gemini_url}, fake onchain service at {services.onchain_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        services.stop()
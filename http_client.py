@@ -0,0 +1,170 @@
+import asyncio
+import importlib.util
+import os
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+import tracing
+
+# --- Connection Pool Configuration ---
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "50"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+# HTTP/2 needs the optional `h2` package (pip install httpx[http2]).
+HTTP_ENABLE_HTTP2 = os.getenv("HTTP_ENABLE_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+# -------------------------------------
+
+class HttpClientPool:
+    """
+    One keep-alive httpx.AsyncClient shared by every outbound call an agent makes.
+    Requests to a single host are capped by a semaphore on top of httpx's global
+    limits, and in-flight/waiting counts are published as metrics so pool
+    saturation shows up in the agent's metrics log.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        per_host_limit: int = HTTP_PER_HOST_LIMIT,
+        timeout: float = HTTP_TIMEOUT,
+        http2: bool = HTTP_ENABLE_HTTP2,
+    ):
+        self.name = name
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.http2 = http2
+        self._client: httpx.AsyncClient | None = None
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+
+        self._in_flight = metrics.gauge(f"http.{name}.in_flight")
+        self._waiting = metrics.gauge(f"http.{name}.waiting_for_host_slot")
+        self._saturated = metrics.counter(f"http.{name}.host_limit_saturated")
+        self._errors = metrics.counter(f"http.{name}.errors")
+        self._latency = metrics.histogram(f"http.{name}.latency_s")
+
+    async def start(self):
+        """Opens the shared client. Safe to call more than once."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+
+    async def stop(self):
+        """Closes the shared client and all its pooled connections."""
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    def attach(self, agent):
+        """Ties the pool's lifetime to the agent's startup and shutdown events."""
+
+        @agent.on_event("startup")
+        async def start_http_pool(ctx):
+            await self.start()
+
+        @agent.on_event("shutdown")
+        async def stop_http_pool(ctx):
+            await self.stop()
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return slot
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Sends a request through the pool. Calls made inside a traced span are recorded as child spans."""
+        if tracing.current_span() is not None:
+            with tracing.span(f"http.{method} {urlsplit(url).path}", url=url) as http_span:
+                response = await self._request(method, url, **kwargs)
+                http_span.set(status_code=response.status_code)
+                return response
+        return await self._request(method, url, **kwargs)
+
+    async def _acquire_host_slot(self, url: str) -> asyncio.Semaphore:
+        if self._client is None:
+            await self.start()
+
+        slot = self._host_slot(url)
+        if slot.locked():
+            self._saturated.inc()
+        self._waiting.inc()
+        try:
+            await slot.acquire()
+        finally:
+            self._waiting.dec()
+        return slot
+
+    def _total_timeout(self, kwargs) -> float | None:
+        """
+        A number passed as `timeout=` limits the whole call, waiting for a host slot included; httpx
+        itself only applies it to each phase (connect, write, each read) separately.
+        """
+        timeout = kwargs.get("timeout", self.timeout)
+        return timeout if isinstance(timeout, (int, float)) else None
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        timeout = self._total_timeout(kwargs)
+        try:
+            return await asyncio.wait_for(self._send(method, url, **kwargs), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._errors.inc()
+            raise httpx.TimeoutException(f"{method} {url} did not complete within {timeout}s")
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        slot = await self._acquire_host_slot(url)
+        self._in_flight.inc()
+        start_time = time.perf_counter()
+        try:
+            return await self._client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self._errors.inc()
+            raise
+        finally:
+            self._latency.observe(time.perf_counter() - start_time)
+            self._in_flight.dec()
+            slot.release()
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """
+        Like request(), but yields the response before its body is read so it can be consumed incrementally.
+        `timeout=` limits the wait for a host slot; reading the body is up to the caller.
+        """
+        timeout = self._total_timeout(kwargs)
+        try:
+            slot = await asyncio.wait_for(self._acquire_host_slot(url), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._errors.inc()
+            raise httpx.TimeoutException(f"{method} {url} waited more than {timeout}s for a connection")
+        self._in_flight.inc()
+        start_time = time.perf_counter()
+        try:
+            async with self._client.stream(method, url, **kwargs) as response:
+                yield response
+        except httpx.HTTPError:
+            self._errors.inc()
+            raise
+        finally:
+            self._latency.observe(time.perf_counter() - start_time)
+            self._in_flight.dec()
+            slot.release()
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
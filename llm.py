@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import time
+
+import metrics
+import tracing
+
+# --- LLM Call Configuration ---
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "90"))
+# ------------------------------
+
+class LLMTimeoutError(Exception):
+    """Raised when a model call does not finish within its timeout."""
+
+class LLMGateway:
+    """
+    Runs model calls on the async Gemini client without blocking the agent's event loop.
+    At most `max_concurrency` calls run at once; the rest wait in FIFO order, and
+    the time spent waiting for a slot is recorded separately from the call itself.
+    """
+
+    def __init__(self, model, name: str = "llm", max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT):
+        self.model = model
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+        self._queued = metrics.gauge(f"{name}.queued")
+        self._in_flight = metrics.gauge(f"{name}.in_flight")
+        self._queue_wait = metrics.histogram(f"{name}.queue_wait_s")
+        self._latency = metrics.histogram(f"{name}.latency_s")
+        self._first_chunk = metrics.histogram(f"{name}.time_to_first_chunk_s")
+        self._timeouts = metrics.counter(f"{name}.timeouts")
+        self._errors = metrics.counter(f"{name}.errors")
+
+    async def _acquire_slot(self):
+        queued_at = time.perf_counter()
+        queued_at_wall = time.time()
+        self._queued.inc()
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued.dec()
+        self._queue_wait.observe(time.perf_counter() - queued_at)
+        if tracing.current_span() is not None:
+            tracing.record_span("llm.queue_wait", queued_at_wall, time.time())
+
+    async def generate(self, prompt: str, timeout: float | None = None) -> str:
+        """Generates a completion for prompt and returns its text. `timeout` includes the wait for a slot."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.perf_counter() + timeout
+        try:
+            return await asyncio.wait_for(self._generate(prompt, deadline), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._timeouts.inc()
+            raise LLMTimeoutError(f"Model call timed out after {timeout}s")
+
+    async def _generate(self, prompt: str, deadline: float) -> str:
+        await self._acquire_slot()
+        self._in_flight.inc()
+        start_time = time.perf_counter()
+        try:
+            response = await self.model.generate_content_async(prompt, request_options={"timeout": max(deadline - start_time, 0)})
+            return response.text
+        except Exception:
+            self._errors.inc()
+            raise
+        finally:
+            self._latency.observe(time.perf_counter() - start_time)
+            self._in_flight.dec()
+            self._slots.release()
+
+    async def stream(self, prompt: str, timeout: float | None = None):
+        """
+        Generates a completion for prompt, yielding its text chunk by chunk as the model produces it.
+        `timeout` covers the whole call, from waiting for a slot to the last chunk.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.perf_counter() + timeout
+
+        try:
+            await asyncio.wait_for(self._acquire_slot(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._timeouts.inc()
+            raise LLMTimeoutError(f"Model call timed out after {timeout}s waiting for a slot")
+        self._in_flight.inc()
+        start_time = time.perf_counter()
+        first_chunk = True
+        try:
+            left = max(deadline - start_time, 0)
+            response = await asyncio.wait_for(
+                self.model.generate_content_async(prompt, stream=True, request_options={"timeout": left}),
+                timeout=left,
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - time.perf_counter(), 0))
+                except StopAsyncIteration:
+                    break
+                if first_chunk:
+                    self._first_chunk.observe(time.perf_counter() - start_time)
+                    first_chunk = False
+                if chunk.text:
+                    yield chunk.text
+        except asyncio.TimeoutError:
+            self._timeouts.inc()
+            raise LLMTimeoutError(f"Model call timed out after {timeout}s")
+        except Exception:
+            self._errors.inc()
+            raise
+        finally:
+            self._latency.observe(time.perf_counter() - start_time)
+            self._in_flight.dec()
+            self._slots.release()
+
+class GeminiText:
+    """A model response or streamed chunk, exposing .text like the google.generativeai client's."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+def _candidate_text(payload: dict) -> str:
+    candidates = payload.get("candidates") or [{}]
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+class GeminiRestModel:
+    """
+    Calls a Gemini-compatible REST endpoint through an HttpClientPool. Has the same
+    generate_content_async interface as genai.GenerativeModel, so LLMGateway can use
+    either; this one can be pointed at any base URL, e.g. the benchmark's Gemini stub.
+    """
+
+    def __init__(self, http_pool, endpoint: str, model_name: str, api_key: str | None = None):
+        self.http_pool = http_pool
+        self.url = f"{endpoint.rstrip('/')}/v1beta/models/{model_name}"
+        self.headers = {"x-goog-api-key": api_key} if api_key else {}
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, request_options: dict | None = None):
+        timeout = (request_options or {}).get("timeout")
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if stream:
+            return self._stream(body, timeout)
+
+        response = await self.http_pool.post(f"{self.url}:generateContent", json=body, headers=self.headers, timeout=timeout)
+        response.raise_for_status()
+        return GeminiText(_candidate_text(response.json()))
+
+    async def _stream(self, body: dict, timeout: float | None):
+        # Server-sent events, one JSON response per "data:" line
+        async with self.http_pool.stream(
+            "POST", f"{self.url}:streamGenerateContent", params={"alt": "sse"}, json=body, headers=self.headers, timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    yield GeminiText(_candidate_text(json.loads(line[len("data:"):])))
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+
+import metrics
+import resilience
+
+# --- Market Source Defaults ---
+MARKET_SOURCE_DEADLINE = float(os.getenv("MARKET_SOURCE_DEADLINE", "2"))
+# Send a second request to a source that hasn't answered after this many seconds. 0 disables hedging.
+MARKET_SOURCE_HEDGE_AFTER = float(os.getenv("MARKET_SOURCE_HEDGE_AFTER", "0.5"))
+# ------------------------------
+
+class MarketSource(ABC):
+    """
+    One feed of market data. fetch() returns a flat dict of values that are merged
+    into `section` of the snapshot (e.g. "opportunities" or "prices").
+    """
+
+    def __init__(self, name: str, section: str, deadline: float = MARKET_SOURCE_DEADLINE, hedge_after: float = 0):
+        self.name = name
+        self.section = section
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+
+    @abstractmethod
+    async def fetch(self, http_pool) -> dict:
+        ...
+
+class StaticSource(MarketSource):
+    """Fixed values, used as the baseline that live feeds are merged over."""
+
+    def __init__(self, name: str, section: str, data: dict):
+        super().__init__(name, section)
+        self.data = data
+
+    async def fetch(self, http_pool) -> dict:
+        return dict(self.data)
+
+class HttpJsonSource(MarketSource):
+    """
+    A JSON endpoint returning a flat object of values, e.g. the onchain service's /market-data.
+    Calls go through a circuit breaker and concurrency limit named after the source, so a
+    failing feed is skipped immediately instead of waiting out its deadline.
+    """
+
+    def __init__(self, name: str, section: str, url: str, deadline: float = MARKET_SOURCE_DEADLINE, hedge_after: float = MARKET_SOURCE_HEDGE_AFTER):
+        super().__init__(name, section, deadline, hedge_after)
+        self.url = url
+        self.endpoint = resilience.endpoint(f"scout.source.{name}", latency_target=deadline)
+
+    async def fetch(self, http_pool) -> dict:
+        response = await self.endpoint.request(http_pool, "GET", self.url, timeout=self.deadline)
+        response.raise_for_status()
+        data = response.json()
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object from {self.url}, got {type(data).__name__}")
+        return data
+
+def sources_from_config(config: str) -> list[MarketSource]:
+    """Builds HttpJsonSources from a JSON list of {"name", "section", "url", "deadline"?, "hedge_after"?}."""
+    return [HttpJsonSource(**entry) for entry in json.loads(config)]
+
+async def _fetch_hedged(source: MarketSource, http_pool) -> dict:
+    """Fetches from a source, sending one backup request if the first is slower than hedge_after."""
+    if source.hedge_after <= 0:
+        return await source.fetch(http_pool)
+
+    attempts = [asyncio.create_task(source.fetch(http_pool))]
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=source.hedge_after)
+        if not done:
+            metrics.counter(f"scout.source.{source.name}.hedged").inc()
+            attempts.append(asyncio.create_task(source.fetch(http_pool)))
+
+        # Return the first attempt that succeeds; only fail once every attempt has failed
+        pending = set(attempts)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+            if not pending:
+                raise next(iter(done)).exception()
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+
+async def _fetch_one(source: MarketSource, http_pool) -> tuple[dict | None, dict]:
+    start_time = time.perf_counter()
+    try:
+        values = await asyncio.wait_for(_fetch_hedged(source, http_pool), timeout=source.deadline)
+        status = {"ok": True}
+    except asyncio.TimeoutError:
+        values, status = None, {"ok": False, "error": f"deadline of {source.deadline}s exceeded"}
+        metrics.counter(f"scout.source.{source.name}.deadline_exceeded").inc()
+    except Exception as e:
+        values, status = None, {"ok": False, "error": str(e)}
+        metrics.counter(f"scout.source.{source.name}.errors").inc()
+    latency_ms = round((time.perf_counter() - start_time) * 1000, 2)
+    metrics.histogram(f"scout.source.{source.name}.latency_s").observe(latency_ms / 1000)
+    return values, {**status, "latency_ms": latency_ms}
+
+async def gather_market_data(sources: list[MarketSource], http_pool) -> dict:
+    """
+    Queries every source concurrently and merges whatever arrived within each
+    source's deadline, later sources overriding earlier ones. Every value's origin
+    is recorded under "provenance" and each source's outcome under "sources".
+    """
+    results = await asyncio.gather(*(_fetch_one(source, http_pool) for source in sources))
+
+    snapshot = {"timestamp": int(time.time()), "sources": {}, "provenance": {}}
+    for source, (values, status) in zip(sources, results):
+        snapshot["sources"][source.name] = status
+        if values is None:
+            continue
+        section = snapshot.setdefault(source.section, {})
+        for key, value in values.items():
+            section[key] = value
+            snapshot["provenance"][f"{source.section}.{key}"] = {"source": source.name, "latency_ms": status["latency_ms"]}
+    return snapshot
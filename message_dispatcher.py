@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from uagents.communication import send_sync_message
+
+import metrics
+import tracing
+
+# --- Dispatcher Configuration ---
+DISPATCH_CONCURRENCY = int(os.getenv("API_DISPATCH_CONCURRENCY", "16"))
+DISPATCH_QUEUE_SIZE = int(os.getenv("API_DISPATCH_QUEUE_SIZE", "1000"))
+DISPATCH_SEND_TIMEOUT = float(os.getenv("API_DISPATCH_SEND_TIMEOUT", "10"))
+# --------------------------------
+
+class AgentMessageDispatcher:
+    """
+    Forwards messages from the (synchronous) Flask handlers to an agent.
+    A single background thread runs one asyncio loop with a fixed number of
+    sender tasks fed from a bounded queue. submit() never blocks: it returns
+    False when the queue is full so the caller can push back on the client.
+    """
+
+    def __init__(
+        self,
+        destination: str,
+        sender,
+        concurrency: int = DISPATCH_CONCURRENCY,
+        queue_size: int = DISPATCH_QUEUE_SIZE,
+        send_timeout: float = DISPATCH_SEND_TIMEOUT,
+    ):
+        self.destination = destination
+        self.sender = sender
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue | None = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+
+        self._queue_depth = metrics.gauge("api.dispatch.queue_depth")
+        self._queue_wait = metrics.histogram("api.dispatch.queue_wait_s")
+        self._send_latency = metrics.histogram("api.dispatch.send_latency_s")
+        self._sent = metrics.counter("api.dispatch.sent")
+        self._failed = metrics.counter("api.dispatch.failed")
+        self._rejected = metrics.counter("api.dispatch.rejected")
+
+    def start(self):
+        """Starts the dispatcher thread if it is not already running."""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            thread = threading.Thread(target=self._run, name="agent-dispatcher", daemon=True)
+            thread.start()
+            self._ready.wait()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        for _ in range(self.concurrency):
+            self._loop.create_task(self._worker())
+        self._ready.set()
+        self._loop.run_forever()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending
+
+    def submit(self, message, parent=None) -> bool:
+        """
+        Queues a message for delivery. Returns False if the queue is full.
+        If `parent` (a Span) is given, the time queued and the send are traced.
+        """
+        self.start()
+        with self._pending_lock:
+            if self._pending >= self.queue_size:
+                self._rejected.inc()
+                return False
+            self._pending += 1
+            self._queue_depth.set(self._pending)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (message, time.perf_counter(), time.time(), parent))
+        return True
+
+    async def _worker(self):
+        while True:
+            message, queued_at, queued_at_wall, parent = await self._queue.get()
+            with self._pending_lock:
+                self._pending -= 1
+                self._queue_depth.set(self._pending)
+            self._queue_wait.observe(time.perf_counter() - queued_at)
+            if parent is not None:
+                tracing.record_span("api.dispatch_queue", queued_at_wall, time.time(), parent=parent)
+
+            start_time = time.perf_counter()
+            send_started_at = time.time()
+            try:
+                # We are not expecting a direct response here, so we can use a short timeout.
+                # The real responses will come back through the /api/agent-responses endpoint.
+                await send_sync_message(self.destination, message, sender=self.sender, timeout=self.send_timeout)
+                self._sent.inc()
+            except Exception as e:
+                self._failed.inc()
+                logging.error(f"Failed to forward message to agent: {e}")
+            finally:
+                self._send_latency.observe(time.perf_counter() - start_time)
+                if parent is not None:
+                    tracing.record_span("api.dispatch_send", send_started_at, time.time(), parent=parent)
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from collections import deque
+
+# How often (in seconds) agents log a metrics snapshot. 0 disables logging.
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "60"))
+
+class Counter:
+    """A monotonically increasing count."""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self._value += amount
+
+    def summary(self):
+        return self._value
+
+class Gauge:
+    """A value that goes up and down, remembering the highest value it reached."""
+
+    def __init__(self):
+        self._value = 0
+        self._peak = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+            self._peak = max(self._peak, value)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+            self._peak = max(self._peak, self._value)
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def summary(self):
+        return {"value": self._value, "peak": self._peak}
+
+class Histogram:
+    """Keeps a sliding window of recent observations and reports percentiles over it."""
+
+    def __init__(self, window: int = 1024):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._samples.append(value)
+            self._count += 1
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+        if not samples:
+            return {"count": count}
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "count": count,
+            "p50": round(percentile(0.50), 6),
+            "p95": round(percentile(0.95), 6),
+            "p99": round(percentile(0.99), 6),
+            "max": round(samples[-1], 6),
+        }
+
+class MetricsRegistry:
+    """Process-wide collection of named metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, kind):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind()
+            return metric
+
+    def counter(self, name: str) -> Counter:
+        return self._get_or_create(name, Counter)
+
+    def gauge(self, name: str) -> Gauge:
+        return self._get_or_create(name, Gauge)
+
+    def histogram(self, name: str) -> Histogram:
+        return self._get_or_create(name, Histogram)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {name: metric.summary() for name, metric in sorted(metrics.items())}
+
+registry = MetricsRegistry()
+
+def counter(name: str) -> Counter:
+    return registry.counter(name)
+
+def gauge(name: str) -> Gauge:
+    return registry.gauge(name)
+
+def histogram(name: str) -> Histogram:
+    return registry.histogram(name)
+
+def snapshot() -> dict:
+    return registry.snapshot()
+
+def attach(agent, interval: float = METRICS_LOG_INTERVAL):
+    """Logs a metrics snapshot from the agent every `interval` seconds."""
+    if interval <= 0:
+        return
+
+    @agent.on_interval(period=interval)
+    async def log_metrics(ctx):
+        ctx.logger.info(f"metrics: {json.dumps(snapshot())}")
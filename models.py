@@ -1,18 +1,44 @@
 from uagents import Model
 from datetime import datetime, timezone
 
+class TraceContext(Model):
+    trace_id: str
+    span_id: str # The sender's span; the receiver's spans become its children
+    session_id: str | None = None
+    sent_at: float | None = None # Unix time the message was sent, to measure agent transit
+
 class StrategyRequest(Model):
     user_query: str
     session_id: str
+    stream: bool = False # Ask for StrategyChunk messages while the proposal is being generated
+    request_id: str | None = None # Echoed in the StrategyResponse, so the reply finds the request it answers
+    deadline: float | None = None # Unix time after which the result is no longer wanted; timeouts downstream derive from it
+    trace: TraceContext | None = None
 
 class StrategyResponse(Model):
     strategy_description: str
     session_id: str
+    request_id: str | None = None
+
+class StrategyChunk(Model):
+    type: str = "strategy_chunk"
+    session_id: str
+    index: int # Position of this chunk in the stream, starting at 0
+    text: str
 
 class ExecuteStrategy(Model):
     strategy: str
     strategy_id: str
     feePayer: str | None = None
+    deadline: float | None = None
+    trace: TraceContext | None = None
+
+# Asks the Execution Agent to build a proposal's transaction before the user decides to execute it
+class PrebuildTransaction(Model):
+    strategy: str
+    strategy_id: str
+    feePayer: str | None = None
+    trace: TraceContext | None = None
 
 class ExecutionResult(Model):
     success: bool
@@ -26,15 +52,20 @@ class StrategyProposal(Model):
     description: str
     details: dict[str, str] | None = None
     strategy_id: str
+    degraded: list[str] | None = None # Inputs replaced by fallbacks because they were late or failed, e.g. ["risk_assessment"]
 
 class CommandMessage(Model):
     command: str
     payload: dict | None = None
     session_id: str
+    deadline: float | None = None
+    trace: TraceContext | None = None
 
 class SubmitSignedTransaction(Model):
     signed_tx_b64: str
     strategy_id: str
+    deadline: float | None = None
+    trace: TraceContext | None = None
 
 class UnsignedTransactionProposal(Model):
     type: str = "unsigned_transaction_proposal"
@@ -43,20 +74,44 @@ class UnsignedTransactionProposal(Model):
 
 class ScoutRequest(Model):
     query: str # e.g., "Kamino USDC APY", "SOL price"
+    deadline: float | None = None
+    trace: TraceContext | None = None
 
 class ScoutResponse(Model):
     data: dict # e.g., {"kaminos_usdc_apy": "12%", "timestamp": "..."}
     error: str | None = None
+    snapshot_age: float | None = None # Seconds since the market data was fetched
+
+# Subscribes the sender to market snapshot pushes from the Scout Agent, or renews its subscription
+class MarketSubscribe(Model):
+    known_version: int | None = None # Latest version the subscriber holds; a full snapshot is sent if it is behind
+
+class MarketSnapshotDelta(Model):
+    version: int
+    base_version: int | None = None # The version `changes` applies to; None means `changes` is a full snapshot
+    changes: dict # Top-level sections of the snapshot that changed, with their new values
+    removed: list[str] = [] # Top-level sections that disappeared
+    snapshot_age: float | None = None # Age of the snapshot in seconds when it was pushed
 
 class RiskRequest(Model):
     protocol_name: str
     strategy_details: dict # Details about the strategy to assess
+    deadline: float | None = None
+    trace: TraceContext | None = None
 
 class RiskResponse(Model):
     risk_score: float # e.g., 0.1 (low) to 1.0 (high)
     assessment: str # e.g., "Low risk due to audited protocol and high TVL"
     error: str | None = None
 
+class RiskBatchRequest(Model):
+    requests: list[RiskRequest] # Scored independently, in order
+    deadline: float | None = None
+    trace: TraceContext | None = None
+
+class RiskBatchResponse(Model):
+    responses: list[RiskResponse] # One per request, in the same order
+
 class StatusMessage(Model):
     type: str = "status_update"
     message: str
@@ -0,0 +1,101 @@
+import asyncio
+import os
+
+import httpx
+from uagents import Model
+
+import metrics
+
+# --- Outbox Configuration ---
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL_MS", "10")) / 1000
+OUTBOX_MAX_BATCH = int(os.getenv("OUTBOX_MAX_BATCH", "16"))
+OUTBOX_COALESCE_STATUS = os.getenv("OUTBOX_COALESCE_STATUS", "1") == "1"
+# ----------------------------
+
+def _is_status_update(content) -> bool:
+    return isinstance(content, dict) and content.get("type") == "status_update"
+
+class SessionOutbox:
+    """
+    Buffers responses per session and delivers them to the API in bulk.
+    A session's buffer is flushed OUTBOX_FLUSH_INTERVAL after its first message
+    or as soon as it holds OUTBOX_MAX_BATCH messages. With coalescing enabled, a
+    status update that is still buffered is replaced by the next one, since the
+    client would only ever see the newer progress.
+    """
+
+    def __init__(
+        self,
+        http_pool,
+        url: str,
+        flush_interval: float = OUTBOX_FLUSH_INTERVAL,
+        max_batch: int = OUTBOX_MAX_BATCH,
+        coalesce_status: bool = OUTBOX_COALESCE_STATUS,
+    ):
+        self.http_pool = http_pool
+        self.url = url
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.coalesce_status = coalesce_status
+        self._pending: dict[str, list] = {}
+        self._timers: dict[str, asyncio.Task] = {}
+        self._sends: dict[str, asyncio.Task] = {}
+
+        self._queued = metrics.counter("outbox.messages_queued")
+        self._coalesced = metrics.counter("outbox.messages_coalesced")
+        self._requests = metrics.counter("outbox.http_requests")
+        self._batch_size = metrics.histogram("outbox.batch_size")
+
+    async def put(self, session_id: str, content):
+        """Queues a response (plain text, JSON-able value or Model) for a session."""
+        if isinstance(content, Model):
+            content = content.model_dump(mode="json")
+        self._queued.inc()
+
+        items = self._pending.setdefault(session_id, [])
+        if self.coalesce_status and items and _is_status_update(content) and _is_status_update(items[-1]):
+            items[-1] = content
+            self._coalesced.inc()
+        else:
+            items.append(content)
+
+        if len(items) >= self.max_batch or self.flush_interval <= 0:
+            await self.flush(session_id)
+        elif session_id not in self._timers:
+            self._timers[session_id] = asyncio.create_task(self._flush_later(session_id))
+
+    async def _flush_later(self, session_id: str):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush(session_id)
+
+    async def flush(self, session_id: str):
+        """Sends everything buffered for a session in one request."""
+        timer = self._timers.pop(session_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        items = self._pending.pop(session_id, None)
+        if not items:
+            return
+
+        # Chain sends per session so batches reach the API in the order they were queued
+        send = asyncio.create_task(self._send(session_id, items, self._sends.get(session_id)))
+        self._sends[session_id] = send
+        await send
+
+    async def _send(self, session_id: str, items: list, previous: asyncio.Task | None):
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        self._requests.inc()
+        self._batch_size.observe(len(items))
+        try:
+            await self.http_pool.post(self.url, json={"session_id": session_id, "contents": items}, timeout=30)
+        except httpx.RequestError as e:
+            print(f"Error sending responses to API: {e}")
+        finally:
+            if self._sends.get(session_id) is asyncio.current_task():
+                del self._sends[session_id]
+
+    async def close(self):
+        """Flushes every session's buffer."""
+        await asyncio.gather(*(self.flush(session_id) for session_id in list(self._pending)))
@@ -0,0 +1,198 @@
+"""
+Fast-fail protection for calls to upstream HTTP services such as the onchain service.
+
+Each upstream endpoint gets a circuit breaker and an adaptive (AIMD) concurrency limit.
+When the endpoint fails repeatedly, the circuit opens and calls fail immediately until a
+probe succeeds. When it slows down, the limit shrinks and calls beyond it are rejected,
+so a degraded upstream sheds load instead of queuing it.
+"""
+import asyncio
+import os
+import time
+
+import metrics
+
+# --- Upstream Resilience Configuration ---
+# Consecutive failures that open an endpoint's circuit, and how long it stays open before a probe call
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "15"))
+# Concurrent calls allowed per endpoint: the limit grows by one per `limit` successes and is cut
+# by CONCURRENCY_BACKOFF on a failure or a call slower than the endpoint's latency target
+CONCURRENCY_INITIAL_LIMIT = float(os.getenv("CONCURRENCY_INITIAL_LIMIT", "10"))
+CONCURRENCY_MIN_LIMIT = float(os.getenv("CONCURRENCY_MIN_LIMIT", "1"))
+CONCURRENCY_MAX_LIMIT = float(os.getenv("CONCURRENCY_MAX_LIMIT", "50"))
+CONCURRENCY_BACKOFF = float(os.getenv("CONCURRENCY_BACKOFF", "0.7"))
+CONCURRENCY_LATENCY_TARGET = float(os.getenv("CONCURRENCY_LATENCY_TARGET", "5"))
+# -----------------------------------------
+
+class UpstreamUnavailableError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open or whose concurrency limit is reached."""
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and consecutive failures are counted. Open: calls are rejected
+    until `open_seconds` have passed. Half-open: a single probe call decides whether the
+    circuit closes again or re-opens.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._open_until = 0.0
+        self._probing = False
+
+        self._state_gauge = metrics.gauge(f"resilience.{name}.circuit_state") # 0 closed, 1 half-open, 2 open
+        self._opened = metrics.counter(f"resilience.{name}.circuit_opened")
+
+    def allow(self) -> tuple[bool, bool]:
+        """Whether a call may go ahead, and whether it is the half-open circuit's probe."""
+        if self.state == self.OPEN and time.monotonic() >= self._open_until:
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.CLOSED:
+            return True, False
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True, True
+        return False, False
+
+    def record(self, success: bool, probe: bool = False):
+        """
+        Applies a call's outcome. Once the circuit has left CLOSED only the probe decides it:
+        calls admitted before it opened that finish afterwards are ignored.
+        """
+        if probe:
+            self._probing = False
+            if success:
+                self._failures = 0
+                self._set_state(self.CLOSED)
+            else:
+                self._open()
+            return
+        if self.state != self.CLOSED:
+            return
+        if success:
+            self._failures = 0
+            return
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            self._open()
+
+    def release_probe(self):
+        """Lets another probe through after one ended without a verdict (e.g. it was cancelled)."""
+        self._probing = False
+
+    def _open(self):
+        self._open_until = time.monotonic() + self.open_seconds
+        if self.state != self.OPEN:
+            self._opened.inc()
+        self._set_state(self.OPEN)
+
+    def _set_state(self, state: int):
+        self.state = state
+        self._state_gauge.set(state)
+
+class AdaptiveLimiter:
+    """
+    Additive-increase/multiplicative-decrease concurrency limit. Calls over the limit are
+    rejected rather than queued.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = CONCURRENCY_INITIAL_LIMIT,
+        min_limit: float = CONCURRENCY_MIN_LIMIT,
+        max_limit: float = CONCURRENCY_MAX_LIMIT,
+        backoff: float = CONCURRENCY_BACKOFF,
+        latency_target: float = CONCURRENCY_LATENCY_TARGET,
+    ):
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.in_flight = 0
+
+        self._limit_gauge = metrics.gauge(f"resilience.{name}.concurrency_limit")
+        self._in_flight_gauge = metrics.gauge(f"resilience.{name}.in_flight")
+        self._limit_gauge.set(self.limit)
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        self._in_flight_gauge.inc()
+        return True
+
+    def release(self, success: bool | None, latency: float):
+        """Ends a call. `success` is None for calls abandoned by the caller, which don't move the limit."""
+        self.in_flight -= 1
+        self._in_flight_gauge.dec()
+        if success is None:
+            return
+        if success and latency <= self.latency_target:
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+        else:
+            self.limit = max(self.limit * self.backoff, self.min_limit)
+        self._limit_gauge.set(self.limit)
+
+class ResilientEndpoint:
+    """
+    One upstream endpoint guarded by a circuit breaker and an adaptive limiter. Transport
+    errors, timeouts, 5xx and 429 responses count as failures; other responses as successes.
+    """
+
+    def __init__(self, name: str, latency_target: float = CONCURRENCY_LATENCY_TARGET):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self.limiter = AdaptiveLimiter(name, latency_target=latency_target)
+
+        self._rejected_open = metrics.counter(f"resilience.{name}.rejected_circuit_open")
+        self._rejected_limit = metrics.counter(f"resilience.{name}.rejected_concurrency_limit")
+
+    async def request(self, http_pool, method: str, url: str, **kwargs):
+        """Sends the request through http_pool, or raises UpstreamUnavailableError without sending it."""
+        allowed, probe = self.breaker.allow()
+        if not allowed:
+            self._rejected_open.inc()
+            raise UpstreamUnavailableError(f"{self.name} is unavailable (circuit open)")
+        if not self.limiter.try_acquire():
+            if probe:
+                self.breaker.release_probe()
+            self._rejected_limit.inc()
+            raise UpstreamUnavailableError(f"{self.name} is overloaded ({self.limiter.in_flight} calls in flight)")
+
+        start_time = time.perf_counter()
+        success = None
+        try:
+            response = await http_pool.request(method, url, **kwargs)
+            success = response.status_code < 500 and response.status_code != 429
+            return response
+        except asyncio.CancelledError:
+            # Abandoned by the caller (a hedge, a deadline): only a verdict if it had already run too long
+            if time.perf_counter() - start_time > self.limiter.latency_target:
+                success = False
+            raise
+        except Exception:
+            success = False
+            raise
+        finally:
+            self.limiter.release(success, time.perf_counter() - start_time)
+            if success is not None:
+                self.breaker.record(success, probe)
+            elif probe:
+                self.breaker.release_probe()
+
+_endpoints: dict[str, ResilientEndpoint] = {}
+
+def endpoint(name: str, latency_target: float = CONCURRENCY_LATENCY_TARGET) -> ResilientEndpoint:
+    """The process-wide guard for the named endpoint, created on first use."""
+    guarded = _endpoints.get(name)
+    if guarded is None:
+        guarded = _endpoints[name] = ResilientEndpoint(name, latency_target)
+    return guarded
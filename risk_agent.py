@@ -1,6 +1,10 @@
 from uagents import Agent, Context, Protocol
-from models import RiskRequest, RiskResponse
+from models import RiskRequest, RiskResponse, RiskBatchRequest, RiskBatchResponse
 from address_book import save_address
+from deadlines import drop_if_expired
+from risk_engine import RiskEngine
+import metrics
+import tracing
 
 # The Risk Agent
 risk_agent = Agent(
@@ -13,30 +17,36 @@ risk_agent = Agent(
 # Define a protocol for communication with the Risk Agent
 risk_proto = Protocol("Risk", version="1.0")
 
+# Rules are loaded from risk_rules.json (or RISK_RULES_FILE) and compiled once at startup
+risk_engine = RiskEngine.from_file()
+metrics.attach(risk_agent)
+
 @risk_proto.on_message(model=RiskRequest)
+@tracing.traced_handler("risk.handle_request")
 async def handle_risk_request(ctx: Context, sender: str, msg: RiskRequest):
     ctx.logger.info(f"Received risk request from {sender} for protocol {msg.protocol_name} and strategy: {msg.strategy_details}")
+    if drop_if_expired(ctx, "risk", msg.deadline):
+        return
 
-    # --- Simulated Risk Assessment (Replace with actual MeTTa/rule-based logic) ---
-    risk_score = 0.5 # Default to medium risk
-    assessment = "Medium risk: General assessment based on protocol type."
-
-    if "Marinade" in msg.protocol_name or "Kamino" in msg.protocol_name:
-        risk_score = 0.2
-        assessment = "Low risk: Established protocol with good track record."
-    elif "Drift" in msg.protocol_name:
-        risk_score = 0.4
-        assessment = "Medium-low risk: Well-known derivatives platform."
-    elif "Sonic" in msg.protocol_name and "new" in msg.strategy_details.get("description", "").lower():
-        risk_score = 0.7
-        assessment = "Medium-high risk: Newer ecosystem, potential for higher volatility."
-    elif "Degen" in msg.strategy_details.get("title", ""):
-        risk_score = 0.9
-        assessment = "High risk: Volatile assets and/or new protocols involved."
-    # ---------------------------------------------------------------------------
+    risk_score, assessment = risk_engine.score(msg.protocol_name, msg.strategy_details)
 
     await ctx.send(sender, RiskResponse(risk_score=risk_score, assessment=assessment))
 
+@risk_proto.on_message(model=RiskBatchRequest)
+@tracing.traced_handler("risk.handle_batch")
+async def handle_risk_batch_request(ctx: Context, sender: str, msg: RiskBatchRequest):
+    ctx.logger.info(f"Received batch risk request from {sender} for {len(msg.requests)} protocols")
+    if drop_if_expired(ctx, "risk", msg.deadline):
+        return
+    metrics.histogram("risk.batch_size").observe(len(msg.requests))
+
+    responses = []
+    for request in msg.requests:
+        risk_score, assessment = risk_engine.score(request.protocol_name, request.strategy_details)
+        responses.append(RiskResponse(risk_score=risk_score, assessment=assessment))
+
+    await ctx.send(sender, RiskBatchResponse(responses=responses))
+
 # Include the risk protocol
 risk_agent.include(risk_proto)
 
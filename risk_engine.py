@@ -0,0 +1,50 @@
+import json
+import os
+import re
+
+RISK_RULES_FILE = os.getenv("RISK_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_rules.json"))
+
+DEFAULT_RISK_SCORE = 0.5 # Default to medium risk
+DEFAULT_ASSESSMENT = "Medium risk: General assessment based on protocol type."
+
+class RiskRule:
+    """
+    One row of the rule table. `match` maps a field (protocol_name, or any key of
+    strategy_details such as title/description) to substrings; the rule applies
+    when every listed field contains at least one of its substrings.
+    """
+
+    def __init__(self, name: str, match: dict[str, list[str]], risk_score: float, assessment: str):
+        self.name = name
+        self.risk_score = risk_score
+        self.assessment = assessment
+        # One case-insensitive alternation per field, compiled once at load time
+        self.matchers = [
+            (field, re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE))
+            for field, terms in match.items()
+        ]
+
+    def matches(self, protocol_name: str, strategy_details: dict) -> bool:
+        for field, pattern in self.matchers:
+            value = protocol_name if field == "protocol_name" else strategy_details.get(field, "")
+            if not pattern.search(str(value)):
+                return False
+        return True
+
+class RiskEngine:
+    """Scores protocol/strategy pairs against an ordered rule table. The first matching rule wins."""
+
+    def __init__(self, rules: list[RiskRule]):
+        self.rules = rules
+
+    @classmethod
+    def from_file(cls, path: str = RISK_RULES_FILE) -> "RiskEngine":
+        with open(path, "r") as f:
+            return cls([RiskRule(**rule) for rule in json.load(f)])
+
+    def score(self, protocol_name: str, strategy_details: dict) -> tuple[float, str]:
+        """Returns (risk_score, assessment) for one protocol/strategy pair."""
+        for rule in self.rules:
+            if rule.matches(protocol_name, strategy_details):
+                return rule.risk_score, rule.assessment
+        return DEFAULT_RISK_SCORE, DEFAULT_ASSESSMENT
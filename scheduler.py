@@ -0,0 +1,116 @@
+import asyncio
+import functools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import metrics
+import tracing
+
+# --- Priority Scheduling Configuration ---
+# Concurrent requests per priority class, highest priority first. A signed transaction's
+# blockhash expires within about a minute, so submissions go ahead of execute builds,
+# which go ahead of new strategy queries and speculative pre-builds.
+PRIORITY_SUBMIT_CONCURRENCY = int(os.getenv("PRIORITY_SUBMIT_CONCURRENCY", "32"))
+PRIORITY_EXECUTE_CONCURRENCY = int(os.getenv("PRIORITY_EXECUTE_CONCURRENCY", "16"))
+PRIORITY_CHAT_CONCURRENCY = int(os.getenv("PRIORITY_CHAT_CONCURRENCY", "32"))
+PRIORITY_PREBUILD_CONCURRENCY = int(os.getenv("PRIORITY_PREBUILD_CONCURRENCY", "4"))
+# Shared by every class; when it is the limit, freed slots go to the highest-priority waiter
+PRIORITY_MAX_CONCURRENCY = int(os.getenv("PRIORITY_MAX_CONCURRENCY", "64"))
+# -----------------------------------------
+
+DEFAULT_BUDGETS = {
+    "submit": PRIORITY_SUBMIT_CONCURRENCY,
+    "execute": PRIORITY_EXECUTE_CONCURRENCY,
+    "chat": PRIORITY_CHAT_CONCURRENCY,
+    "prebuild": PRIORITY_PREBUILD_CONCURRENCY,
+}
+
+class PriorityScheduler:
+    """
+    Admits an agent's requests by priority class. Each class has its own concurrency
+    budget, and all of them share `max_concurrency`. Waiting requests are admitted
+    highest class first, in arrival order within a class, so a slow class can't hold
+    up a more urgent one. Time spent waiting is recorded per class.
+    """
+
+    def __init__(self, name: str, budgets: dict[str, int] | None = None, max_concurrency: int = PRIORITY_MAX_CONCURRENCY):
+        self.budgets = dict(DEFAULT_BUDGETS if budgets is None else budgets) # In priority order
+        self.max_concurrency = max_concurrency
+        self._running = {priority: 0 for priority in self.budgets}
+        self._waiters: dict[str, deque[asyncio.Future]] = {priority: deque() for priority in self.budgets}
+        self._total = 0
+
+        self._queued = {priority: metrics.gauge(f"scheduler.{name}.{priority}.queued") for priority in self.budgets}
+        self._running_gauges = {priority: metrics.gauge(f"scheduler.{name}.{priority}.running") for priority in self.budgets}
+        self._queue_wait = {priority: metrics.histogram(f"scheduler.{name}.{priority}.queue_wait_s") for priority in self.budgets}
+
+    def _has_room(self, priority: str) -> bool:
+        return self._running[priority] < self.budgets[priority] and self._total < self.max_concurrency
+
+    def _admit(self, priority: str):
+        self._running[priority] += 1
+        self._total += 1
+        self._running_gauges[priority].inc()
+
+    def _dispatch(self):
+        for priority, waiters in self._waiters.items():
+            while waiters and self._has_room(priority):
+                waiter = waiters.popleft()
+                self._queued[priority].dec()
+                if waiter.done():
+                    continue # Cancelled while waiting; its slot goes to the next waiter
+                self._admit(priority)
+                waiter.set_result(None)
+
+    def _release(self, priority: str):
+        self._running[priority] -= 1
+        self._total -= 1
+        self._running_gauges[priority].dec()
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str):
+        """Holds one of `priority`'s slots for the duration of the block, waiting for it if needed."""
+        queued_at = time.perf_counter()
+        # Anything already waiting is held back by its own class's budget or by the shared limit,
+        # so room for this class means nothing is ahead of it
+        if self._has_room(priority):
+            self._admit(priority)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[priority].append(waiter)
+            self._queued[priority].inc()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(priority) # Admitted just as it was cancelled
+                elif waiter in self._waiters[priority]: # Not already skipped by _dispatch
+                    self._waiters[priority].remove(waiter)
+                    self._queued[priority].dec()
+                raise
+        queue_wait = time.perf_counter() - queued_at
+        self._queue_wait[priority].observe(queue_wait)
+        span = tracing.current_span()
+        if span is not None:
+            span.set(priority=priority, queue_wait_s=round(queue_wait, 6))
+
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def prioritized(self, priority):
+        """
+        Handler decorator running the whole handler in a slot. `priority` is a class name,
+        or a function of the message returning one.
+        """
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(ctx, sender, msg):
+                async with self.slot(priority(msg) if callable(priority) else priority):
+                    return await handler(ctx, sender, msg)
+            return wrapper
+        return decorator
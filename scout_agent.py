@@ -1,9 +1,16 @@
 from uagents import Agent, Context, Protocol
-from models import ScoutRequest, ScoutResponse
+from models import MarketSnapshotDelta, MarketSubscribe, ScoutRequest, ScoutResponse
 from address_book import save_address
-import json
+from cache import SnapshotCache
+from deadlines import drop_if_expired
+from http_client import HttpClientPool
+from market_sources import HttpJsonSource, StaticSource, gather_market_data, sources_from_config
+import metrics
+import tracing
+import asyncio
+import copy
+import os
 import time
-import httpx
 
 # The Scout Agent
 scout_agent = Agent(
@@ -13,45 +20,135 @@ scout_agent = Agent(
     endpoint=["http://127.0.0.1:8004/submit"],
 )
 
-ONCHAIN_SERVICE_URL = "http://localhost:3001"
+ONCHAIN_SERVICE_URL = os.getenv("ONCHAIN_SERVICE_URL", "http://localhost:3001")
+
+# --- Market Snapshot Cache Configuration ---
+MARKET_DATA_TTL = float(os.getenv("MARKET_DATA_TTL", "15"))
+MARKET_DATA_MAX_STALE = float(os.getenv("MARKET_DATA_MAX_STALE", "60"))
+MARKET_DATA_TIMEOUT = float(os.getenv("MARKET_DATA_TIMEOUT", "5"))
+# -------------------------------------------
+
+# --- Market Push Configuration ---
+# How often subscribers are sent what changed. An empty delta still goes out, as a heartbeat.
+MARKET_PUSH_INTERVAL = float(os.getenv("MARKET_PUSH_INTERVAL", "5"))
+# Subscriptions lapse unless renewed within this many seconds
+MARKET_SUBSCRIPTION_TTL = float(os.getenv("MARKET_SUBSCRIPTION_TTL", "60"))
+# ---------------------------------
+
+http_pool = HttpClientPool("scout_agent")
+http_pool.attach(scout_agent)
+metrics.attach(scout_agent)
 
 # Define a protocol for communication with the Scout Agent
 scout_proto = Protocol("Scout", version="1.0")
 
+SIMULATED_MARKET_DATA = {
+    "opportunities": {
+        "kaminos_usdc_apy": "12.5%",
+        "drift_stablecoin_apy": "11.2%",
+        "sonic_usdc_sol_apy": "16.8%",
+    },
+    "network_health": {
+        "solana_congestion": "moderate",
+        "solana_tps": 2500,
+        "sonic_congestion": "low",
+    },
+    "prices": {
+        "SOL": 150.00,
+        "USDC": 1.00,
+        "USDT": 1.00,
+    }
+}
+
+# Simulated values form the baseline; live feeds are listed after them so their values win.
+# Extra feeds (per-protocol APYs, price oracles, ...) can be added through MARKET_SOURCES, a JSON list of
+# {"name": ..., "section": ..., "url": ..., "deadline": ..., "hedge_after": ...}.
+market_sources = [
+    StaticSource(f"simulated_{section}", section, data) for section, data in SIMULATED_MARKET_DATA.items()
+]
+market_sources.append(HttpJsonSource("onchain_market_data", "opportunities", f"{ONCHAIN_SERVICE_URL}/market-data", deadline=MARKET_DATA_TIMEOUT))
+market_sources += sources_from_config(os.getenv("MARKET_SOURCES", "[]"))
+
+async def fetch_market_snapshot() -> dict:
+    """Fans out to every market source concurrently and merges what arrived before each deadline."""
+    return await gather_market_data(market_sources, http_pool)
+
+market_cache = SnapshotCache("scout.market_cache", fetch_market_snapshot, ttl=MARKET_DATA_TTL, max_stale=MARKET_DATA_MAX_STALE)
+
 @scout_proto.on_message(model=ScoutRequest)
+@tracing.traced_handler("scout.handle_request")
 async def handle_scout_request(ctx: Context, sender: str, msg: ScoutRequest):
     ctx.logger.info(f"Received scout request from {sender}: {msg.query}")
+    if drop_if_expired(ctx, "scout", msg.deadline):
+        return
 
-    simulated_data = {
-        "timestamp": int(time.time()),
-        "opportunities": {
-            "kaminos_usdc_apy": "12.5%",
-            "drift_stablecoin_apy": "11.2%",
-            "sonic_usdc_sol_apy": "16.8%",
-        },
-        "network_health": {
-            "solana_congestion": "moderate",
-            "solana_tps": 2500,
-            "sonic_congestion": "low",
-        },
-        "prices": {
-            "SOL": 150.00,
-            "USDC": 1.00,
-            "USDT": 1.00,
-        }
-    }
+    market_data, snapshot_age = await market_cache.get()
+    tracing.annotate(snapshot_age=snapshot_age)
+    for name, status in market_data["sources"].items():
+        if not status["ok"]:
+            ctx.logger.warning(f"Market source {name} missing from snapshot: {status['error']}")
+
+    await ctx.send(sender, ScoutResponse(data=copy.deepcopy(market_data), snapshot_age=snapshot_age))
+
+# Subscriber address -> when its subscription lapses (time.monotonic())
+market_subscribers: dict[str, float] = {}
+published_snapshot: dict = {}
+published_version = 0
+
+pushes_sent = metrics.counter("scout.push.deltas_sent")
+full_snapshots_sent = metrics.counter("scout.push.full_snapshots_sent")
+subscribers_gauge = metrics.gauge("scout.push.subscribers")
+
+def snapshot_delta(old: dict, new: dict) -> tuple[dict, list[str]]:
+    changes = {key: value for key, value in new.items() if old.get(key) != value}
+    removed = [key for key in old if key not in new]
+    return changes, removed
+
+@scout_proto.on_message(model=MarketSubscribe)
+async def handle_market_subscribe(ctx: Context, sender: str, msg: MarketSubscribe):
+    if sender not in market_subscribers:
+        ctx.logger.info(f"{sender} subscribed to market snapshots")
+    market_subscribers[sender] = time.monotonic() + MARKET_SUBSCRIPTION_TTL
+    subscribers_gauge.set(len(market_subscribers))
+
+    if not published_version:
+        return # Nothing published yet; the first push will be a full snapshot
+    if msg.known_version != published_version:
+        full_snapshots_sent.inc()
+        await ctx.send(sender, MarketSnapshotDelta(
+            version=published_version,
+            changes=copy.deepcopy(published_snapshot),
+            snapshot_age=market_cache.age(),
+        ))
+
+@scout_agent.on_interval(period=MARKET_PUSH_INTERVAL)
+async def push_market_snapshot(ctx: Context):
+    global published_snapshot, published_version
+
+    now = time.monotonic()
+    for address in [a for a, expires_at in market_subscribers.items() if expires_at <= now]:
+        del market_subscribers[address]
+    subscribers_gauge.set(len(market_subscribers))
+    if not market_subscribers:
+        return
+
+    market_data, snapshot_age = await market_cache.get()
+    changes, removed = snapshot_delta(published_snapshot, market_data)
+    if not published_version:
+        delta = MarketSnapshotDelta(version=1, changes=copy.deepcopy(market_data), snapshot_age=snapshot_age)
+    else:
+        version = published_version + 1 if changes or removed else published_version
+        delta = MarketSnapshotDelta(
+            version=version,
+            base_version=published_version,
+            changes=copy.deepcopy(changes),
+            removed=removed,
+            snapshot_age=snapshot_age,
+        )
+    published_snapshot, published_version = copy.deepcopy(market_data), delta.version
 
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{ONCHAIN_SERVICE_URL}/market-data")
-            response.raise_for_status()
-            market_data = response.json()
-            # Merge the real-time data with the simulated data
-            simulated_data["opportunities"].update(market_data)
-    except httpx.RequestError as e:
-        ctx.logger.error(f"Error fetching market data from onchain-service: {e}")
-
-    await ctx.send(sender, ScoutResponse(data=simulated_data))
+    pushes_sent.inc(len(market_subscribers))
+    await asyncio.gather(*(ctx.send(address, delta) for address in list(market_subscribers)))
 
 # Include the scout protocol
 scout_agent.include(scout_proto)
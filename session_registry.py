@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import quote
+
+# --- Session Registry Configuration ---
+# "memory" (one API worker), "file:<directory>" (workers on one host) or "redis://..." (any number of hosts)
+API_SESSION_REGISTRY = os.getenv("API_SESSION_REGISTRY", "memory")
+# Sessions not seen (connected, chatting) for this many seconds are forgotten
+API_SESSION_TTL = float(os.getenv("API_SESSION_TTL", "3600"))
+# --------------------------------------
+
+class SessionRegistry(ABC):
+    """
+    The set of live client sessions, shared by every API worker so an agent reply
+    can be accepted by whichever worker receives it. Entries expire `ttl` seconds
+    after they were last added or touched.
+    """
+
+    def __init__(self, ttl: float = API_SESSION_TTL):
+        self.ttl = ttl
+
+    @abstractmethod
+    def add(self, session_id: str):
+        """Registers a session, or refreshes its expiry if it is already registered."""
+
+    @abstractmethod
+    def remove(self, session_id: str): ...
+
+    @abstractmethod
+    def __contains__(self, session_id: str) -> bool: ...
+
+class MemorySessionRegistry(SessionRegistry):
+    """Process-local registry: only correct with a single API worker."""
+
+    def __init__(self, ttl: float = API_SESSION_TTL):
+        super().__init__(ttl)
+        self._expires_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def add(self, session_id: str):
+        now = time.monotonic()
+        with self._lock:
+            self._expires_at[session_id] = now + self.ttl
+            if now >= self._next_purge:
+                self._purge(now)
+
+    def remove(self, session_id: str):
+        with self._lock:
+            self._expires_at.pop(session_id, None)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            expires_at = self._expires_at.get(session_id)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def _purge(self, now: float):
+        for session_id in [s for s, expires_at in self._expires_at.items() if expires_at <= now]:
+            del self._expires_at[session_id]
+        self._next_purge = now + self.ttl / 10
+
+class FileSessionRegistry(SessionRegistry):
+    """
+    One empty file per session in a shared directory, its mtime the last time it was
+    seen. Lets several API workers on one host share sessions without extra services.
+    """
+
+    def __init__(self, directory: str, ttl: float = API_SESSION_TTL):
+        super().__init__(ttl)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._next_purge = 0.0
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, quote(session_id, safe=""))
+
+    def add(self, session_id: str):
+        path = self._path(session_id)
+        with open(path, "a"):
+            os.utime(path)
+        if time.monotonic() >= self._next_purge:
+            self._purge()
+
+    def remove(self, session_id: str):
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, session_id: str) -> bool:
+        try:
+            return os.path.getmtime(self._path(session_id)) > time.time() - self.ttl
+        except FileNotFoundError:
+            return False
+
+    def _purge(self):
+        cutoff = time.time() - self.ttl
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime <= cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass # Removed by another worker
+        self._next_purge = time.monotonic() + self.ttl / 10
+
+class RedisSessionRegistry(SessionRegistry):
+    """Keys with a Redis-side expiry. Needs the `redis` package (pip install redis)."""
+
+    def __init__(self, url: str, ttl: float = API_SESSION_TTL, prefix: str = "martian:session:"):
+        super().__init__(ttl)
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def add(self, session_id: str):
+        self.client.set(self.prefix + session_id, 1, ex=max(int(self.ttl), 1))
+
+    def remove(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return bool(self.client.exists(self.prefix + session_id))
+
+def session_registry_from_config(config: str = API_SESSION_REGISTRY, ttl: float = API_SESSION_TTL) -> SessionRegistry:
+    """Builds the registry described by an API_SESSION_REGISTRY value."""
+    if config == "memory":
+        return MemorySessionRegistry(ttl)
+    if config.startswith("file:"):
+        return FileSessionRegistry(config[len("file:"):], ttl)
+    if config.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionRegistry(config, ttl)
+    raise ValueError(f"Unknown session registry '{config}'; expected memory, file:<directory> or redis://...")
@@ -0,0 +1,55 @@
+import json
+import os
+
+import socketio
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows; writes are then not serialized
+    fcntl = None
+
+class FileMessageQueue(socketio.PubSubManager):
+    """
+    Socket.IO client manager that relays emits between API workers on one host through
+    an append-only JSON-lines file, in place of Redis or another broker. Every worker
+    tails the file and delivers the emits addressed to its own clients.
+
+    The file only grows, so this is meant for development and tests; use a redis://
+    message queue in production.
+    """
+
+    name = "file"
+
+    def __init__(self, path: str, channel: str = "socketio", write_only: bool = False, poll_interval: float = 0.02, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self.poll_interval = poll_interval
+
+    def _publish(self, data):
+        line = json.dumps({"channel": self.channel, "data": data}) + "\n"
+        with open(self.path, "a") as f:
+            # Serialize writers so lines from different workers never interleave
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.write(line)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _listen(self):
+        with open(self.path, "a+") as f:
+            f.seek(0, os.SEEK_END) # Only emits published after this worker started
+            partial = ""
+            while True:
+                line = f.readline()
+                if not line:
+                    # The server's sleep, so the listener yields under eventlet/gevent instead of blocking the hub
+                    self.server.sleep(self.poll_interval)
+                    continue
+                partial += line
+                if not partial.endswith("\n"):
+                    continue # The writer hasn't finished this line yet
+                message, partial = json.loads(partial), ""
+                if message.get("channel") == self.channel:
+                    yield message["data"]
@@ -0,0 +1,47 @@
+"""
+Just enough of Solana's transaction wire format to identify a transaction.
+
+A serialized transaction starts with a compact-u16 count of signatures followed by
+that many 64-byte ed25519 signatures, then the message. The first signature is the
+fee payer's and is the transaction's id on the network.
+"""
+import base64
+import binascii
+
+SIGNATURE_LENGTH = 64
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+def b58encode(data: bytes) -> str:
+    number = int.from_bytes(data, "big")
+    encoded = ""
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = B58_ALPHABET[remainder] + encoded
+    return "1" * (len(data) - len(data.lstrip(b"\0"))) + encoded
+
+def decode_compact_u16(data: bytes, offset: int = 0) -> tuple[int, int]:
+    """Decodes a compact-u16 (1-3 bytes, 7 bits each, little-endian). Returns (value, bytes read)."""
+    value = 0
+    for index in range(3):
+        if offset + index >= len(data):
+            raise ValueError("Truncated compact-u16")
+        byte = data[offset + index]
+        value |= (byte & 0x7F) << (7 * index)
+        if not byte & 0x80:
+            return value, index + 1
+    raise ValueError("compact-u16 longer than 3 bytes")
+
+def transaction_signature(tx_b64: str) -> str | None:
+    """
+    Returns the base58 first signature of a base64-encoded signed transaction, or None
+    if it can't be parsed or hasn't been signed by the fee payer yet (all-zero signature).
+    """
+    try:
+        tx = base64.b64decode(tx_b64, validate=True)
+        count, offset = decode_compact_u16(tx)
+    except (binascii.Error, ValueError):
+        return None
+    signature = tx[offset:offset + SIGNATURE_LENGTH]
+    if count < 1 or len(signature) < SIGNATURE_LENGTH or not any(signature):
+        return None
+    return b58encode(signature)
@@ -5,6 +5,9 @@ from uagents import Agent, Context, Model, Protocol
 import json
 import re
 import asyncio
+import hashlib
+import string
+import time
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,16 +17,36 @@ from uagents_core.types import DeliveryStatus
 from datetime import datetime, timezone
 from uuid import uuid4
 
-from models import StrategyRequest, StrategyResponse, StrategyProposal, ScoutRequest, ScoutResponse, RiskRequest, RiskResponse
-from address_book import save_address, get_address
+from models import StrategyRequest, StrategyResponse, StrategyProposal, StrategyChunk, ScoutRequest, ScoutResponse, MarketSubscribe, MarketSnapshotDelta, RiskRequest, RiskBatchRequest, RiskBatchResponse
+from address_book import attach_replica, wait_for_address
+from balancer import ReplicaBalancer
+from cache import SingleFlight, TTLCache
+from deadlines import drop_if_expired, forward, hop_timeout
+from http_client import HttpClientPool
+from llm import GeminiRestModel, LLMGateway
+from risk_engine import DEFAULT_RISK_SCORE
+from strategy_classifier import STRATEGY_CLASSIFIER_MODE, classify_query, record_fast_path_decision, record_shadow_comparison
+import metrics
+import tracing
+
+# --- Replica Configuration ---
+# Run more replicas with distinct STRATEGY_AGENT_REPLICA (e.g. "2") and STRATEGY_AGENT_PORT values
+STRATEGY_AGENT_REPLICA = os.getenv("STRATEGY_AGENT_REPLICA", "")
+STRATEGY_AGENT_PORT = int(os.getenv("STRATEGY_AGENT_PORT", "8002"))
+# ------------------------------
 
 # The Strategy Agent
 strategy_agent = Agent(
     name="martian_strategy_agent",
-    port=8002,
-    seed="martian_strategy_agent_secret_seed_phrase",
-    endpoint=["http://127.0.0.1:8002/submit"],
+    port=STRATEGY_AGENT_PORT,
+    seed=f"martian_strategy_agent_secret_seed_phrase{STRATEGY_AGENT_REPLICA}",
+    endpoint=[f"http://127.0.0.1:{STRATEGY_AGENT_PORT}/submit"],
+    # Run each request's handler as its own task: a handler awaits the whole pipeline, and
+    # one at a time would leave the LLM pool, coalescing and streaming with a single caller
+    handle_messages_concurrently=True,
 )
+# Every running replica registers itself and keeps a heartbeat in the address book
+attach_replica(strategy_agent, "strategy_agent")
 
 # --- Gemini API Configuration ---
 try:
@@ -32,87 +55,286 @@ except AttributeError:
     print("ERROR: Gemini API key not found. Please set the GEMINI_API_KEY environment variable.")
     exit(1)
 
-gemini = genai.GenerativeModel('gemini-2.5-flash')
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Send model calls to this REST endpoint instead of Google's, e.g. the Gemini stub in fake_services.py
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+http_pool = HttpClientPool("strategy_agent")
+http_pool.attach(strategy_agent)
+
+if GEMINI_API_ENDPOINT:
+    gemini = GeminiRestModel(http_pool, GEMINI_API_ENDPOINT, GEMINI_MODEL, api_key=os.environ.get("GEMINI_API_KEY"))
+else:
+    gemini = genai.GenerativeModel(GEMINI_MODEL)
+llm = LLMGateway(gemini, name="strategy.llm")
 # --------------------------------
 
+# Market snapshots older than this (in seconds) are logged as stale.
+SCOUT_MAX_SNAPSHOT_AGE = float(os.getenv("SCOUT_MAX_SNAPSHOT_AGE", "60"))
+
+# --- Strategy Result Cache Configuration ---
+STRATEGY_CACHE_TTL = float(os.getenv("STRATEGY_CACHE_TTL", "120"))
+STRATEGY_CACHE_MAX_ENTRIES = int(os.getenv("STRATEGY_CACHE_MAX_ENTRIES", "1024"))
+STRATEGY_CACHE_MAX_BYTES = int(os.getenv("STRATEGY_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+# Numbers in the market data are rounded to this many significant digits before fingerprinting
+STRATEGY_CACHE_SIGNIFICANT_DIGITS = int(os.getenv("STRATEGY_CACHE_SIGNIFICANT_DIGITS", "2"))
+# -------------------------------------------
+
+classifier_fast_path = metrics.counter("strategy.classifier.fast_path")
+classifier_fallback = metrics.counter("strategy.classifier.llm_fallback")
+
+# --- Degraded Mode Configuration ---
+# Seconds to wait for the Scout and Risk agents before generating the strategy with whatever has
+# arrived: the last known market snapshot stands in for the Scout, a default profile for the Risk
+# Agent. Failed queries are replaced the same way. 0 waits for both and fails if either does.
+STRATEGY_SOFT_DEADLINE = float(os.getenv("STRATEGY_SOFT_DEADLINE", "10"))
+# -----------------------------------
+
+DEFAULT_RISK_PROFILE = {"score": DEFAULT_RISK_SCORE, "assessment": "Risk assessment unavailable; medium risk assumed."}
+
+degraded_proposals = metrics.counter("strategy.degraded")
+
+# Stream LLM output to requesters that ask for it (StrategyRequest.stream)
+STRATEGY_STREAMING = os.getenv("STRATEGY_STREAMING", "1") == "1"
+
+strategy_flight = SingleFlight("strategy.pipeline")
+requests_coalesced = metrics.counter("strategy.requests_coalesced")
+
+strategy_cache = TTLCache(
+    "strategy.result_cache",
+    ttl=STRATEGY_CACHE_TTL,
+    max_entries=STRATEGY_CACHE_MAX_ENTRIES,
+    max_bytes=STRATEGY_CACHE_MAX_BYTES,
+)
+
+class ChunkRelay:
+    """
+    Forwards streamed LLM output to every streaming request attached to one pipeline run.
+    Each request has its own queue and sender task, so it gets every chunk once and in
+    order, starting with any published before it attached.
+    """
+
+    def __init__(self):
+        self.chunks: list[str] = []
+        self.queues: list[asyncio.Queue] = []
+
+    def subscribe(self, ctx: Context, sender: str, session_id: str) -> asyncio.Task:
+        """
+        Registers a requester and returns its sender task, which ends once the relay is closed
+        and every chunk has been sent. Does not yield to the event loop, so it can't race the
+        pipeline finishing.
+        """
+        queue = asyncio.Queue()
+        for text in self.chunks:
+            queue.put_nowait(text)
+        self.queues.append(queue)
+        task = asyncio.create_task(self._deliver(ctx, sender, session_id, queue))
+        chunk_senders.add(task)
+        task.add_done_callback(chunk_senders.discard)
+        return task
+
+    async def _deliver(self, ctx: Context, sender: str, session_id: str, queue: asyncio.Queue):
+        index = 0
+        while (text := await queue.get()) is not None:
+            await ctx.send(sender, StrategyChunk(session_id=session_id, index=index, text=text))
+            index += 1
+
+    def publish(self, text: str):
+        self.chunks.append(text)
+        for queue in self.queues:
+            queue.put_nowait(text)
+
+    def close(self):
+        """Ends every sender task once it has sent what was published."""
+        for queue in self.queues:
+            queue.put_nowait(None)
+
+# Chunk relays of the pipeline runs currently in flight, keyed like strategy_flight
+chunk_relays: dict[str, ChunkRelay] = {}
+# Keeps the relays' sender tasks referenced until they finish
+chunk_senders: set[asyncio.Task] = set()
+
+# Most recent market data received from the Scout Agent
+last_market_data: dict | None = None
+
+# --- Live Market Snapshot Configuration ---
+# Strategy requests use the snapshot the Scout pushes if it is at most this many seconds old,
+# and only ask the Scout directly otherwise
+STRATEGY_LIVE_MARKET_MAX_AGE = float(os.getenv("STRATEGY_LIVE_MARKET_MAX_AGE", "30"))
+# Must be shorter than the Scout's MARKET_SUBSCRIPTION_TTL
+MARKET_SUBSCRIPTION_RENEW_INTERVAL = float(os.getenv("MARKET_SUBSCRIPTION_RENEW_INTERVAL", "20"))
+# ------------------------------------------
+
+class LiveMarketSnapshot:
+    """The Scout's market snapshot, kept current by the versioned deltas it pushes."""
+
+    def __init__(self):
+        self.version: int | None = None
+        self.data: dict | None = None
+        self._received_at: float | None = None
+        self._age_when_received = 0.0
+
+    def age(self) -> float | None:
+        """Seconds since the Scout gathered the data, or None if no snapshot has arrived."""
+        if self._received_at is None:
+            return None
+        return self._age_when_received + time.monotonic() - self._received_at
+
+    def apply(self, delta: MarketSnapshotDelta) -> bool:
+        """Applies a pushed delta. Returns False if it is based on a version we don't hold."""
+        if delta.base_version is None:
+            data = dict(delta.changes)
+        elif delta.base_version == self.version and self.data is not None:
+            data = {key: value for key, value in self.data.items() if key not in delta.removed}
+            data.update(delta.changes)
+        else:
+            return False
+        # A new dict each time, so a request still reading the previous snapshot isn't affected
+        self.data, self.version = data, delta.version
+        self._received_at, self._age_when_received = time.monotonic(), delta.snapshot_age or 0.0
+        return True
+
+live_market = LiveMarketSnapshot()
+live_market_hits = metrics.counter("strategy.live_market.hits")
+live_market_fallbacks = metrics.counter("strategy.live_market.fallbacks")
+live_market_resyncs = metrics.counter("strategy.live_market.resyncs")
+
+market_feed_proto = Protocol("MarketFeed", version="1.0")
+
+@strategy_agent.on_interval(period=MARKET_SUBSCRIPTION_RENEW_INTERVAL)
+async def renew_market_subscription(ctx: Context):
+    scout_agent_address = await wait_for_address("scout_agent", timeout=1.0)
+    if scout_agent_address:
+        await ctx.send(scout_agent_address, MarketSubscribe(known_version=live_market.version))
+
+@market_feed_proto.on_message(model=MarketSnapshotDelta)
+async def handle_market_snapshot_delta(ctx: Context, sender: str, msg: MarketSnapshotDelta):
+    if not live_market.apply(msg):
+        # Missed a delta (or the Scout restarted): ask for the full snapshot again
+        live_market_resyncs.inc()
+        await ctx.send(sender, MarketSubscribe(known_version=None))
+
 # Define a protocol for communication with the Strategy Agent
 strategy_comm_proto = Protocol("StrategyComm", version="1.0")
 
-async def query_scout_agent(ctx: Context, user_query: str):
-    scout_agent_address = get_address("scout_agent")
-    if not scout_agent_address:
-        ctx.logger.error("Scout Agent address not found.")
-        return None, "Scout Agent address not found."
-    
-    ctx.logger.info(f"Querying Scout Agent at {scout_agent_address} for opportunities...")
-    scout_response, status = await ctx.send_and_receive(
-        scout_agent_address,
-        ScoutRequest(query=user_query),
-        ScoutResponse,
-        timeout=30
-    )
+scout_balancer = ReplicaBalancer("scout_agent")
+risk_balancer = ReplicaBalancer("risk_agent")
+
+async def query_scout_agent(ctx: Context, user_query: str, deadline: float | None = None):
+    global last_market_data
+
+    # Serve from the pushed snapshot when it is fresh enough, without a round trip
+    live_age = live_market.age()
+    if live_age is not None and live_age <= STRATEGY_LIVE_MARKET_MAX_AGE:
+        live_market_hits.inc()
+        tracing.annotate(live_market_age=live_age)
+        last_market_data = live_market.data
+        return live_market.data, None
+    live_market_fallbacks.inc()
+
+    async with scout_balancer.acquire() as scout_agent_address:
+        if not scout_agent_address:
+            ctx.logger.error("Scout Agent address not found.")
+            return None, "Scout Agent address not found."
+
+        ctx.logger.info(f"Querying Scout Agent at {scout_agent_address} for opportunities...")
+        with tracing.span("strategy.scout_request") as hop:
+            scout_response, status = await ctx.send_and_receive(
+                scout_agent_address,
+                ScoutRequest(query=user_query, deadline=forward(deadline), trace=hop.context()),
+                ScoutResponse,
+                timeout=hop_timeout(deadline, 30)
+            )
+        if status and status.status == DeliveryStatus.FAILED:
+            scout_balancer.report_failure(scout_agent_address)
     
     if not (status.status == DeliveryStatus.DELIVERED and isinstance(scout_response, ScoutResponse)):
         error_detail = status.detail if status else 'timeout'
         ctx.logger.error(f"Failed to get opportunities from Scout Agent: {error_detail}")
         return None, f"Failed to get opportunities from Scout Agent: {error_detail}"
-        
-    return scout_response.data, None
 
-async def query_risk_agent(ctx: Context, user_query: str):
-    risk_agent_address = get_address("risk_agent")
-    if not risk_agent_address:
-        ctx.logger.error("Risk Agent address not found.")
-        return None, "Risk Agent address not found."
-
-    # The risk agent is queried with only the user query for a general assessment.
-    # The dependency on scout agent results is removed to allow for concurrent execution.
-    strategy_details_for_risk = {"user_query": user_query}
-    protocol_name_for_risk = "General"
-
-    ctx.logger.info(f"Querying Risk Agent at {risk_agent_address} for a general assessment...")
-    risk_response, status = await ctx.send_and_receive(
-        risk_agent_address,
-        RiskRequest(protocol_name=protocol_name_for_risk, strategy_details=strategy_details_for_risk),
-        RiskResponse,
-        timeout=30
-    )
+    if scout_response.snapshot_age is not None and scout_response.snapshot_age > SCOUT_MAX_SNAPSHOT_AGE:
+        ctx.logger.warning(f"Scout market snapshot is {scout_response.snapshot_age:.1f}s old (limit {SCOUT_MAX_SNAPSHOT_AGE}s)")
 
-    if not (status.status == DeliveryStatus.DELIVERED and isinstance(risk_response, RiskResponse)):
+    last_market_data = scout_response.data
+    return scout_response.data, None
+
+async def query_risk_agent(ctx: Context, user_query: str, deadline: float | None = None):
+    # The risk agent is queried concurrently with the scout, so it can't wait for this request's
+    # scout results. Alongside the general assessment of the user query, it scores every
+    # opportunity from the most recent market snapshot in the same batch.
+    opportunities = list((last_market_data or {}).get("opportunities", {}))
+    batch = [RiskRequest(protocol_name="General", strategy_details={"user_query": user_query})]
+    batch += [RiskRequest(protocol_name=name, strategy_details={"user_query": user_query}) for name in opportunities]
+
+    async with risk_balancer.acquire() as risk_agent_address:
+        if not risk_agent_address:
+            ctx.logger.error("Risk Agent address not found.")
+            return None, "Risk Agent address not found."
+
+        ctx.logger.info(f"Querying Risk Agent at {risk_agent_address} for {len(batch)} assessments...")
+        with tracing.span("strategy.risk_request", assessments=len(batch)) as hop:
+            risk_response, status = await ctx.send_and_receive(
+                risk_agent_address,
+                RiskBatchRequest(requests=batch, deadline=forward(deadline), trace=hop.context()),
+                RiskBatchResponse,
+                timeout=hop_timeout(deadline, 30)
+            )
+        if status and status.status == DeliveryStatus.FAILED:
+            risk_balancer.report_failure(risk_agent_address)
+
+    if not (status.status == DeliveryStatus.DELIVERED and isinstance(risk_response, RiskBatchResponse)) or len(risk_response.responses) != len(batch):
         error_detail = status.detail if status else 'timeout'
         ctx.logger.error(f"Failed to get risk assessment from Risk Agent: {error_detail}")
         return None, f"Failed to get risk assessment from Risk Agent: {error_detail}"
-        
-    return {"score": risk_response.risk_score, "assessment": risk_response.assessment}, None
-
-@strategy_comm_proto.on_message(model=StrategyRequest)
-async def handle_strategy_request(ctx: Context, sender: str, msg: StrategyRequest):
-    ctx.logger.info(f"Received strategy request from {sender}: {msg.user_query} (Session: {msg.session_id})")
-
-    # 1. Concurrently query Scout and Risk Agents
-    ctx.logger.info("Querying Scout and Risk agents concurrently...")
-    scout_task = query_scout_agent(ctx, msg.user_query)
-    risk_task = query_risk_agent(ctx, msg.user_query)
 
-    results = await asyncio.gather(scout_task, risk_task, return_exceptions=True)
-    
-    current_opportunities, scout_error = (None, str(results[0])) if isinstance(results[0], Exception) else results[0]
-    risk_assessment, risk_error = (None, str(results[1])) if isinstance(results[1], Exception) else results[1]
-
-    if scout_error:
-        ctx.logger.error(f"Scout Agent query failed: {scout_error}")
-        await ctx.send(sender, StrategyResponse(strategy_description=f"Error from Scout Agent: {scout_error}", session_id=msg.session_id))
-        return
-    ctx.logger.info(f"Received opportunities from Scout Agent: {json.dumps(current_opportunities, indent=2)}")
-
-    if risk_error:
-        ctx.logger.error(f"Risk Agent query failed: {risk_error}")
-        await ctx.send(sender, StrategyResponse(strategy_description=f"Error from Risk Agent: {risk_error}", session_id=msg.session_id))
-        return
-    ctx.logger.info(f"Received risk assessment from Risk Agent: {json.dumps(risk_assessment, indent=2)}")
+    general, *per_opportunity = risk_response.responses
+    assessment = {"score": general.risk_score, "assessment": general.assessment}
+    if per_opportunity:
+        assessment["opportunities"] = {
+            name: {"score": response.risk_score, "assessment": response.assessment}
+            for name, response in zip(opportunities, per_opportunity)
+        }
+    return assessment, None
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation.replace("%", "").replace("-", ""))
+
+def normalize_query(user_query: str) -> str:
+    """Lowercases a query and strips punctuation and repeated whitespace."""
+    return " ".join(user_query.lower().translate(_PUNCTUATION).split())
+
+# Bookkeeping fields of a market snapshot that say nothing about market conditions
+MARKET_METADATA_KEYS = {"timestamp", "sources", "provenance"}
+
+def _bucket(value):
+    """Rounds numbers (including "12.5%"-style strings) so small market moves map to the same bucket."""
+    if isinstance(value, dict):
+        return {key: _bucket(item) for key, item in value.items() if key not in MARKET_METADATA_KEYS}
+    if isinstance(value, list):
+        return [_bucket(item) for item in value]
+    if isinstance(value, bool):
+        return value
+    number = value
+    if isinstance(value, str):
+        try:
+            number = float(value.rstrip("%"))
+        except ValueError:
+            return value
+    if isinstance(number, (int, float)):
+        return float(f"{number:.{STRATEGY_CACHE_SIGNIFICANT_DIGITS}g}")
+    return value
+
+def strategy_cache_key(user_query: str, opportunities: dict, risk_assessment: dict) -> str:
+    """Builds the result-cache key from the normalized query, bucketed market data and risk assessment."""
+    fingerprint = json.dumps(
+        {"market": _bucket(opportunities), "risk": _bucket(risk_assessment)},
+        sort_keys=True,
+        default=str,
+    )
+    return f"{normalize_query(user_query)}|{hashlib.sha256(fingerprint.encode()).hexdigest()}"
 
-    # 3. Generate strategy using Gemini with real-time data and risk assessment
-    prompt = f"""You are an expert DeFi strategist for the 'Martian' autonomous yield optimizer.
+def build_strategy_prompt(user_query: str, current_opportunities: dict, risk_assessment: dict) -> str:
+    return f"""You are an expert DeFi strategist for the 'Martian' autonomous yield optimizer.
 Your task is to analyze a user's query and recommend one of the following three strategies.
 Provide only the single most appropriate strategy description as your response, formatted as a JSON object.
 
@@ -152,20 +374,96 @@ Projected APY: 50-200%+ (highly variable)
 Reasoning: Potential for very high rewards from trading fees and farm incentives, but carries significant risk of impermanent loss and token price volatility.
 ###
 
-User Query: "{msg.user_query}"
+User Query: "{user_query}"
 
 Current Real-time Opportunities from Scout Agent:
-{json.dumps(current_opportunities, indent=2)}
+{json.dumps({key: value for key, value in current_opportunities.items() if key not in ("sources", "provenance")}, indent=2)}
 
 Risk Assessment from Risk Agent:
 {json.dumps(risk_assessment, indent=2)}
 
 Based on the user's query, the current real-time opportunities, and the risk assessment, which strategy is the most appropriate?"""
 
+def query_result(task: asyncio.Task) -> tuple:
+    """The (result, error) of a Scout or Risk query task, cancelling it if it hasn't finished."""
+    if not task.done():
+        task.cancel()
+        return None, "no response before the soft deadline"
+    if task.exception() is not None:
+        return None, str(task.exception())
+    return task.result()
+
+async def run_strategy_pipeline(ctx: Context, user_query: str, classification, relay: ChunkRelay | None = None, deadline: float | None = None) -> StrategyProposal | str:
+    """
+    Gathers market data and a risk assessment, then produces a proposal from the
+    result cache or the LLM. Returns the proposal, or an error message for the user.
+    If a relay is given, LLM output is streamed through it as it is generated.
+    Every call is limited to what is left of the request's deadline. Scout or Risk
+    results missing at the soft deadline are replaced by fallbacks, and the
+    proposal's `degraded` field lists them.
+    """
+    # 1. Concurrently query Scout and Risk Agents, waiting at most until the soft deadline
+    ctx.logger.info("Querying Scout and Risk agents concurrently...")
+    scout_task = asyncio.create_task(query_scout_agent(ctx, user_query, deadline))
+    risk_task = asyncio.create_task(query_risk_agent(ctx, user_query, deadline))
+    soft_timeout = hop_timeout(deadline, STRATEGY_SOFT_DEADLINE) if STRATEGY_SOFT_DEADLINE > 0 else None
+    await asyncio.wait([scout_task, risk_task], timeout=soft_timeout)
+
+    current_opportunities, scout_error = query_result(scout_task)
+    risk_assessment, risk_error = query_result(risk_task)
+
+    degraded_inputs = []
+    if scout_error:
+        ctx.logger.error(f"Scout Agent query failed: {scout_error}")
+        fallback_market_data = live_market.data or last_market_data
+        if STRATEGY_SOFT_DEADLINE <= 0 or fallback_market_data is None:
+            return f"Error from Scout Agent: {scout_error}"
+        ctx.logger.warning("Continuing with the last known market snapshot")
+        current_opportunities = fallback_market_data
+        degraded_inputs.append("market_data")
+    ctx.logger.info(f"Received opportunities from Scout Agent: {json.dumps(current_opportunities, indent=2)}")
+
+    if risk_error:
+        ctx.logger.error(f"Risk Agent query failed: {risk_error}")
+        if STRATEGY_SOFT_DEADLINE <= 0:
+            return f"Error from Risk Agent: {risk_error}"
+        ctx.logger.warning("Continuing with the default risk profile")
+        risk_assessment = dict(DEFAULT_RISK_PROFILE)
+        degraded_inputs.append("risk_assessment")
+    ctx.logger.info(f"Received risk assessment from Risk Agent: {json.dumps(risk_assessment, indent=2)}")
+
+    if degraded_inputs:
+        degraded_proposals.inc()
+        for name in degraded_inputs:
+            metrics.counter(f"strategy.degraded.{name}").inc()
+        tracing.annotate(degraded=",".join(degraded_inputs))
+
+    # 2. Reuse a recent proposal for the same query under the same market conditions
+    cache_key = strategy_cache_key(user_query, current_opportunities, risk_assessment)
+    cached_proposal = strategy_cache.get(cache_key)
+    tracing.annotate(cache_hit=cached_proposal is not None)
+    if cached_proposal is not None:
+        ctx.logger.info("Serving cached strategy proposal")
+        return StrategyProposal(**{**cached_proposal, "strategy_id": str(uuid4()), "degraded": degraded_inputs or None})
+
+    # 3. Generate strategy using Gemini with real-time data and risk assessment
+    if drop_if_expired(ctx, "strategy.llm", deadline):
+        return "The strategy request timed out before a proposal could be generated."
+    llm_timeout = hop_timeout(deadline, llm.timeout)
+    prompt = build_strategy_prompt(user_query, current_opportunities, risk_assessment)
+
+    strategy_json_str = ""
     try:
-        response = gemini.generate_content(prompt)
-        strategy_json_str = response.text
-        
+        with tracing.span("strategy.llm", streaming=relay is not None):
+            if relay is not None:
+                parts = []
+                async for text in llm.stream(prompt, timeout=llm_timeout):
+                    parts.append(text)
+                    relay.publish(text)
+                strategy_json_str = "".join(parts)
+            else:
+                strategy_json_str = await llm.generate(prompt, timeout=llm_timeout)
+
         # Extract JSON from markdown code block if present
         match = re.search(r"```json\n(.*?)""```", strategy_json_str, re.DOTALL)
         if match:
@@ -173,40 +471,100 @@ Based on the user's query, the current real-time opportunities, and the risk ass
 
         # Attempt to parse the JSON response
         strategy_data = json.loads(strategy_json_str)
-        
+
         # Validate against the StrategyProposal model
         strategy_data["details"] = strategy_data.get("details") or {}
         strategy_data["title"] = strategy_data.get("title") or "Untitled Strategy Proposal"
         strategy_data["description"] = strategy_data.get("description") or "No description provided."
+        strategy_data["degraded"] = degraded_inputs or None
         strategy_proposal = StrategyProposal(**strategy_data)
-        
-        ctx.logger.info(f"Sending strategy proposal: {strategy_proposal.model_dump_json()}")
-
-        # Send the strategy proposal back to the sender (User Agent)
-        await ctx.send(sender, StrategyResponse(
-            strategy_description=strategy_proposal.model_dump_json(), # Send JSON string
-            session_id=msg.session_id
-        ))
+        # Proposals built on stand-in inputs aren't cached, so the next request tries for fresh ones
+        if not degraded_inputs:
+            strategy_cache.put(cache_key, strategy_proposal.model_dump(), size=len(strategy_proposal.model_dump_json()))
+        if STRATEGY_CLASSIFIER_MODE != "off":
+            record_shadow_comparison(user_query, classification, strategy_proposal.title)
+        return strategy_proposal
 
     except json.JSONDecodeError as e:
         ctx.logger.error(f"Error parsing Gemini JSON response: {e}\nResponse: {strategy_json_str}")
-        await ctx.send(sender, StrategyResponse(
-            strategy_description="I was unable to generate a valid strategy proposal due to a parsing error.",
-            session_id=msg.session_id
-        ))
+        return "I was unable to generate a valid strategy proposal due to a parsing error."
     except Exception as e:
         ctx.logger.error(f"Error calling Gemini API or validating strategy: {e}")
+        return "I was unable to determine a strategy at this time."
+
+@strategy_comm_proto.on_message(model=StrategyRequest)
+@tracing.traced_handler("strategy.handle_request")
+async def handle_strategy_request(ctx: Context, sender: str, msg: StrategyRequest):
+    ctx.logger.info(f"Received strategy request from {sender}: {msg.user_query} (Session: {msg.session_id})")
+    if drop_if_expired(ctx, "strategy", msg.deadline):
+        return # The User Agent has stopped waiting for the answer
+
+    # 0. Answer clear-cut queries locally without the Scout/Risk round trips or the LLM
+    classification = classify_query(msg.user_query)
+    tracing.annotate(classifier_strategy=classification.strategy, classifier_confidence=classification.confidence)
+    if STRATEGY_CLASSIFIER_MODE == "active" and classification.confident:
+        classifier_fast_path.inc()
+        tracing.annotate(path="classifier")
+        strategy_proposal = StrategyProposal(**classification.proposal(str(uuid4())))
+        ctx.logger.info(f"Classifier chose '{classification.strategy}' with confidence {classification.confidence:.2f}")
+        record_fast_path_decision(msg.user_query, classification)
         await ctx.send(sender, StrategyResponse(
-            strategy_description="I was unable to determine a strategy at this time.",
-            session_id=msg.session_id
+            strategy_description=strategy_proposal.model_dump_json(),
+            session_id=msg.session_id,
+            request_id=msg.request_id,
         ))
+        return
+    classifier_fallback.inc()
+
+    # 1. Attach to an identical request that is already in progress instead of starting another pipeline
+    flight_key = normalize_query(msg.user_query)
+    coalesced = strategy_flight.in_flight(flight_key)
+    tracing.annotate(path="coalesced" if coalesced else "pipeline")
+    if coalesced:
+        requests_coalesced.inc()
+        ctx.logger.info(f"Coalescing strategy request for session {msg.session_id} with an in-flight request")
+
+    relay = delivery = None
+    if STRATEGY_STREAMING:
+        if coalesced:
+            relay = chunk_relays.get(flight_key) # None if the run has just finished
+        else:
+            relay = chunk_relays[flight_key] = ChunkRelay()
+        if relay is not None and msg.stream:
+            delivery = relay.subscribe(ctx, sender, msg.session_id)
+
+    async def run_pipeline():
+        try:
+            # Coalesced requests share the run, and with it the deadline of the request that started it
+            return await run_strategy_pipeline(ctx, msg.user_query, classification, relay, msg.deadline)
+        finally:
+            chunk_relays.pop(flight_key, None)
+            if relay is not None:
+                relay.close()
+
+    result = await strategy_flight.do(flight_key, run_pipeline)
+
+    if isinstance(result, StrategyProposal):
+        if coalesced:
+            result = StrategyProposal(**{**result.model_dump(), "strategy_id": str(uuid4())})
+        strategy_description = result.model_dump_json() # Send JSON string
+        ctx.logger.info(f"Sending strategy proposal: {strategy_description}")
+    else:
+        strategy_description = result
+
+    if delivery is not None:
+        await delivery # Every streamed chunk goes out before the response
+
+    # Send the strategy proposal back to the sender (User Agent)
+    await ctx.send(sender, StrategyResponse(strategy_description=strategy_description, session_id=msg.session_id, request_id=msg.request_id))
 
 
 # Include the new strategy communication protocol
 strategy_agent.include(strategy_comm_proto)
+strategy_agent.include(market_feed_proto)
+metrics.attach(strategy_agent)
 
 if __name__ == "__main__":
-    save_address("strategy_agent", strategy_agent.address)
     print(f"Strategy Agent running with address: {strategy_agent.address}")
     strategy_agent.run()
 
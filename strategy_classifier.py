@@ -0,0 +1,211 @@
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+# --- Fast-Path Classifier Configuration ---
+# "off": always use the LLM. "shadow": always use the LLM, but log what the classifier would have chosen.
+# "active": answer confident queries directly and fall back to the LLM for the rest. Both
+# shadow and active log every decision, so the fast path can be audited before and after enabling it.
+STRATEGY_CLASSIFIER_MODE = os.getenv("STRATEGY_CLASSIFIER_MODE", "shadow")
+STRATEGY_CLASSIFIER_THRESHOLD = float(os.getenv("STRATEGY_CLASSIFIER_THRESHOLD", "0.8"))
+# Minimum total keyword weight for the top strategy before it can be considered confident
+STRATEGY_CLASSIFIER_MIN_EVIDENCE = float(os.getenv("STRATEGY_CLASSIFIER_MIN_EVIDENCE", "1.0"))
+# Minimum number of distinct rules the top strategy must match; one keyword alone is never enough
+STRATEGY_CLASSIFIER_MIN_HITS = int(os.getenv("STRATEGY_CLASSIFIER_MIN_HITS", "2"))
+STRATEGY_CLASSIFIER_SHADOW_LOG = os.getenv("STRATEGY_CLASSIFIER_SHADOW_LOG", "classifier_shadow.jsonl")
+# ------------------------------------------
+
+LOW_RISK_STAKING = "Low-Risk Staking"
+MEDIUM_RISK_LP = "Medium-Risk Liquidity Provision"
+HIGH_RISK_DEGEN = 'High-Risk "Degen" Farming'
+
+# The three strategies the LLM prompt chooses between, as ready-made proposals.
+STRATEGY_TEMPLATES = {
+    LOW_RISK_STAKING: {
+        "description": "Stake SOL on a well-established liquid staking platform like Marinade or Jito for stable returns with minimal risk.",
+        "details": {"Projected APY": "7-8%", "Risk Level": "Low", "Protocols": "Marinade, Jito"},
+    },
+    MEDIUM_RISK_LP: {
+        "description": "Provide liquidity to a stablecoin pair such as USDC-USDT on a major DEX like Orca or Raydium to earn trading fees with low impermanent loss risk.",
+        "details": {"Projected APY": "10-15%", "Risk Level": "Medium", "Protocols": "Orca, Raydium"},
+    },
+    HIGH_RISK_DEGEN: {
+        "description": "Provide liquidity to a new, volatile pair such as SOL-WIF or SOL-BONK on Raydium for very high but highly variable rewards.",
+        "details": {"Projected APY": "50-200%+", "Risk Level": "High", "Protocols": "Raydium"},
+    },
+}
+
+# (pattern, weight) per strategy. Patterns are matched as whole words against the lowercased
+# query, with hyphens and underscores treated as spaces ("low-risk" matches "low risk").
+KEYWORD_RULES = {
+    LOW_RISK_STAKING: [
+        (r"stak(e|ing)", 1.0),
+        (r"liquid staking", 1.0),
+        (r"(low|lowest|minimal|no) risk", 1.5),
+        (r"safe(st|ly)?|secure|conservative|preserve", 1.0),
+        (r"marinade|jito|msol|jitosol", 1.5),
+        (r"beginner|passive|stable returns", 0.5),
+    ],
+    MEDIUM_RISK_LP: [
+        (r"liquidity|lp|pool", 1.0),
+        (r"stablecoins?|usdc|usdt", 1.0),
+        (r"(medium|moderate) risk|balanced|moderate", 1.5),
+        (r"orca|trading fees|dex", 1.0),
+        (r"usdc usdt|stable pair", 1.5),
+    ],
+    HIGH_RISK_DEGEN: [
+        (r"degen|ape|moon(shot)?", 2.0),
+        (r"(high|higher|highest|max|maximum) (risk|yield|apy|returns?)", 1.5),
+        (r"aggressive|risky|volatile|yolo", 1.5),
+        (r"meme( ?coins?)?|wif|bonk|100x", 1.5),
+        (r"farm(ing)?", 0.5),
+    ],
+}
+
+_COMPILED_RULES = {
+    strategy: [(re.compile(rf"\b(?:{pattern})\b"), weight) for pattern, weight in rules]
+    for strategy, rules in KEYWORD_RULES.items()
+}
+
+# A keyword is negated when one of these words comes shortly before it in the same clause
+# ("avoid meme coins", "don't want to stake"). Negated keywords count for nothing, and a
+# query containing one is always left to the LLM.
+_NEGATION = re.compile(r"\b(?:avoid|avoiding|don ?t|do not|doesn ?t|dont|no|not|never|without|nothing|stay away from)\b")
+_CLAUSE_BREAK = re.compile(r"[,.;!?]|\b(?:but|however)\b")
+NEGATION_WINDOW_WORDS = 4
+
+def _negated(text: str, start: int) -> bool:
+    clause_start = max((m.end() for m in _CLAUSE_BREAK.finditer(text, 0, start)), default=0)
+    preceding = text[clause_start:start].split()[-NEGATION_WINDOW_WORDS:]
+    return _NEGATION.search(" ".join(preceding)) is not None
+
+@dataclass
+class Classification:
+    strategy: str | None
+    confidence: float
+    scores: dict[str, float] = field(default_factory=dict)
+    hits: dict[str, int] = field(default_factory=dict) # Distinct rules matched per strategy
+    negated: bool = False # Some keyword in the query was negated
+
+    @property
+    def confident(self) -> bool:
+        return (
+            self.strategy is not None
+            and not self.negated
+            and self.confidence >= STRATEGY_CLASSIFIER_THRESHOLD
+            and self.scores[self.strategy] >= STRATEGY_CLASSIFIER_MIN_EVIDENCE
+            and self.hits[self.strategy] >= STRATEGY_CLASSIFIER_MIN_HITS
+        )
+
+    def proposal(self, strategy_id: str) -> dict:
+        """Returns StrategyProposal fields for the chosen strategy."""
+        template = STRATEGY_TEMPLATES[self.strategy]
+        return {
+            "type": "strategy_proposal",
+            "title": self.strategy,
+            "description": template["description"],
+            "details": dict(template["details"]),
+            "strategy_id": strategy_id,
+        }
+
+def classify_query(user_query: str) -> Classification:
+    """
+    Scores a query against the keyword rules. Each rule counts once, and only through
+    a match that isn't negated. Confidence is the top strategy's share of the total score.
+    """
+    text = re.sub(r"[-_']", " ", user_query.lower())
+    scores, hits, negated = {}, {}, False
+    for strategy, rules in _COMPILED_RULES.items():
+        scores[strategy], hits[strategy] = 0.0, 0
+        for pattern, weight in rules:
+            matches = [match for match in pattern.finditer(text)]
+            if not matches:
+                continue
+            if all(_negated(text, match.start()) for match in matches):
+                negated = True
+                continue
+            scores[strategy] += weight
+            hits[strategy] += 1
+    total = sum(scores.values())
+    if total == 0:
+        return Classification(strategy=None, confidence=0.0, scores=scores, hits=hits, negated=negated)
+    strategy = max(scores, key=scores.get)
+    return Classification(strategy=strategy, confidence=scores[strategy] / total, scores=scores, hits=hits, negated=negated)
+
+def strategy_for_title(title: str) -> str | None:
+    """Maps a free-form proposal title (e.g. from the LLM) onto one of the three strategies."""
+    title = title.lower()
+    if "degen" in title or "high-risk" in title or "high risk" in title:
+        return HIGH_RISK_DEGEN
+    if "liquidity" in title or "medium" in title:
+        return MEDIUM_RISK_LP
+    if "stak" in title or "low-risk" in title or "low risk" in title:
+        return LOW_RISK_STAKING
+    return None
+
+def _classifier_record(user_query: str, classification: Classification, source: str) -> dict:
+    return {
+        "timestamp": time.time(),
+        "path": source, # "classifier" if the fast path answered, "llm" otherwise
+        "query": user_query,
+        "classifier": classification.strategy,
+        "confidence": round(classification.confidence, 4),
+        "hits": classification.hits.get(classification.strategy, 0) if classification.strategy else 0,
+        "negated": classification.negated,
+        "confident": classification.confident,
+    }
+
+# Records waiting for the writer thread, as (record, path). The agents only queue them,
+# so logging a decision never puts file I/O on their event loop.
+_pending_records: queue.SimpleQueue = queue.SimpleQueue()
+_writer: threading.Thread | None = None
+_writer_lock = threading.Lock()
+_write_lock = threading.Lock()
+
+def _append_record(record: dict, path: str):
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_forever, name="classifier-log-writer", daemon=True)
+                _writer.start()
+                atexit.register(_write_pending)
+    _pending_records.put((record, path))
+
+def _write_forever():
+    while True:
+        _write_pending(_pending_records.get()) # Waits for a record, then writes it with any queued behind it
+
+def _write_pending(first: tuple[dict, str] | None = None):
+    with _write_lock:
+        pending = [first] if first is not None else []
+        while True:
+            try:
+                pending.append(_pending_records.get_nowait())
+            except queue.Empty:
+                break
+        batches: dict[str, list[dict]] = {}
+        for record, path in pending:
+            batches.setdefault(path, []).append(record)
+        for path, records in batches.items():
+            try:
+                with open(path, "a") as f:
+                    f.write("".join(json.dumps(record) + "\n" for record in records))
+            except OSError as e:
+                print(f"Error writing {len(records)} classifier records to {path}: {e}")
+
+def record_shadow_comparison(user_query: str, classification: Classification, llm_title: str, path: str = STRATEGY_CLASSIFIER_SHADOW_LOG):
+    """Queues the classifier's choice and the LLM's choice for a query for the shadow log."""
+    llm_strategy = strategy_for_title(llm_title)
+    record = _classifier_record(user_query, classification, "llm")
+    record.update(llm=llm_strategy, llm_title=llm_title, agree=classification.strategy == llm_strategy)
+    _append_record(record, path)
+
+def record_fast_path_decision(user_query: str, classification: Classification, path: str = STRATEGY_CLASSIFIER_SHADOW_LOG):
+    """Queues a query the classifier answered without the LLM for the shadow log, so fast-path answers can be audited."""
+    _append_record(_classifier_record(user_query, classification, "classifier"), path)
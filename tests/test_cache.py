@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from cache import SnapshotCache, TTLCache
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    loads = []
+
+    async def loader():
+        loads.append(time.monotonic())
+        await asyncio.sleep(0.01)
+        return len(loads)
+
+    cache = SnapshotCache("test.snapshot", loader, ttl=0.01, max_stale=60)
+
+    async def main():
+        assert (await cache.get())[0] == 1
+        await asyncio.sleep(0.02)
+        stale = [(await cache.get())[0] for _ in range(3)]
+        await cache._refresh_task
+        return stale, (await cache.get())[0]
+
+    assert asyncio.run(main()) == ([1, 1, 1], 2)
+    assert len(loads) == 2
+
+def test_popping_an_expired_entry_counts_it_as_discarded():
+    discarded = []
+    cache = TTLCache("test.pop", ttl=0.01, max_entries=10, on_discard=lambda key, value: discarded.append(key))
+    cache.put("fresh", 1, ttl=60)
+    cache.put("stale", 2)
+    time.sleep(0.02)
+
+    assert cache.pop("fresh") == 1
+    assert cache.pop("stale") is None
+    assert discarded == ["stale"] # A popped entry is the caller's, not discarded
+    assert len(cache) == 0
+    assert cache._expirations.summary() == 1
@@ -0,0 +1,28 @@
+import asyncio
+import time
+
+import pytest
+
+from llm import LLMGateway, LLMTimeoutError
+
+class SlowModel:
+    async def generate_content_async(self, prompt, stream=False, request_options=None):
+        await asyncio.sleep(1)
+
+def test_timeout_includes_the_wait_for_a_slot():
+    gateway = LLMGateway(SlowModel(), name="test.llm", max_concurrency=1)
+
+    async def main():
+        busy = asyncio.create_task(gateway.generate("first"))
+        await asyncio.sleep(0) # Holds the only slot for a second
+        started = time.perf_counter()
+        with pytest.raises(LLMTimeoutError):
+            await gateway.generate("second", timeout=0.1)
+        with pytest.raises(LLMTimeoutError):
+            async for _ in gateway.stream("third", timeout=0.1):
+                pass
+        elapsed = time.perf_counter() - started
+        busy.cancel()
+        return elapsed
+
+    assert asyncio.run(main()) < 0.5
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+
+from resilience import AdaptiveLimiter, CircuitBreaker, ResilientEndpoint, UpstreamUnavailableError
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test.opens", failure_threshold=3, open_seconds=60)
+    for _ in range(2):
+        breaker.record(False)
+    breaker.record(True) # A success resets the count
+    for _ in range(2):
+        breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() == (False, False)
+
+def test_half_open_circuit_admits_one_probe_and_follows_its_outcome():
+    breaker = CircuitBreaker("test.probe", failure_threshold=1, open_seconds=0.01)
+    breaker.record(False)
+    time.sleep(0.02)
+    assert breaker.allow() == (True, True)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() == (False, False) # Only one probe at a time
+
+    breaker.record(False, probe=True)
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.02)
+    assert breaker.allow() == (True, True)
+    breaker.record(True, probe=True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() == (True, False)
+
+def test_calls_admitted_before_the_circuit_opened_do_not_decide_it():
+    breaker = CircuitBreaker("test.straggler", failure_threshold=1, open_seconds=60)
+    assert breaker.allow() == (True, False) # Still running when the circuit opens
+    breaker.record(False)
+    breaker.record(True) # The straggler finishes successfully
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() == (False, False)
+
+def test_straggler_does_not_let_a_second_probe_in():
+    breaker = CircuitBreaker("test.second_probe", failure_threshold=1, open_seconds=0.01)
+    assert breaker.allow() == (True, False)
+    breaker.record(False)
+    time.sleep(0.02)
+    assert breaker.allow() == (True, True)
+    breaker.record(False) # The call admitted while closed finishes during the probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() == (False, False)
+
+def test_limiter_grows_additively_and_backs_off_multiplicatively():
+    limiter = AdaptiveLimiter("test.aimd", initial_limit=2, min_limit=1, max_limit=3, backoff=0.5, latency_target=1)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire() # Over the limit: rejected, not queued
+
+    limiter.release(True, 0.1)
+    limiter.release(True, 0.1)
+    assert limiter.limit == pytest.approx(2.5 + 1 / 2.5)
+    assert limiter.try_acquire()
+    limiter.release(True, 5) # Too slow counts as a failure
+    assert limiter.limit == pytest.approx((2.5 + 1 / 2.5) / 2)
+    for _ in range(5):
+        assert limiter.try_acquire()
+        limiter.release(False, 0.1)
+    assert limiter.limit == 1
+    assert limiter.try_acquire()
+    limiter.release(None, 100) # Abandoned calls don't move the limit
+    assert limiter.limit == 1 and limiter.in_flight == 0
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+class FakePool:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    async def request(self, method, url, **kwargs):
+        if isinstance(self.status_code, Exception):
+            raise self.status_code
+        return Response(self.status_code)
+
+def test_endpoint_fails_fast_once_its_circuit_opens():
+    guarded = ResilientEndpoint("test.endpoint")
+    guarded.breaker.failure_threshold = 2
+
+    async def main():
+        for _ in range(2):
+            await guarded.request(FakePool(503), "GET", "http://upstream/")
+        with pytest.raises(UpstreamUnavailableError):
+            await guarded.request(FakePool(200), "GET", "http://upstream/")
+
+    asyncio.run(main())
+    assert guarded.limiter.in_flight == 0
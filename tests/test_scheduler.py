@@ -0,0 +1,61 @@
+import asyncio
+
+from scheduler import PriorityScheduler
+
+def test_waiter_cancelled_as_a_slot_is_released_does_not_leak_it():
+    scheduler = PriorityScheduler("test.cancel_race", budgets={"submit": 1})
+
+    async def main():
+        hold = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("submit"):
+                await hold.wait()
+
+        async def waiter():
+            async with scheduler.slot("submit"):
+                pass
+
+        running = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        w = asyncio.create_task(waiter())
+        await asyncio.sleep(0) # Both tasks are now parked: one holding the slot, one queued for it
+        hold.set()
+        w.cancel() # Cancelled before the holder gets to release its slot
+        await running
+        await asyncio.gather(w, return_exceptions=True)
+        assert w.cancelled()
+
+        assert scheduler._running == {"submit": 0}
+        assert not scheduler._waiters["submit"]
+        async def acquire_again():
+            async with scheduler.slot("submit"):
+                pass
+        await asyncio.wait_for(acquire_again(), 1) # Hung here while the slot was leaked
+
+    asyncio.run(main())
+
+def test_higher_priority_waiters_are_admitted_first():
+    scheduler = PriorityScheduler("test.order", budgets={"submit": 1, "chat": 1}, max_concurrency=1)
+    admitted = []
+
+    async def main():
+        hold = asyncio.Event()
+
+        async def request(priority, wait=None):
+            async with scheduler.slot(priority):
+                admitted.append(priority)
+                if wait is not None:
+                    await wait.wait()
+
+        first = asyncio.create_task(request("chat", hold))
+        await asyncio.sleep(0)
+        chat = asyncio.create_task(request("chat"))
+        await asyncio.sleep(0)
+        submit = asyncio.create_task(request("submit"))
+        await asyncio.sleep(0)
+        hold.set()
+        await asyncio.gather(first, chat, submit)
+
+    asyncio.run(main())
+    assert admitted == ["chat", "submit", "chat"]
@@ -0,0 +1,34 @@
+import os
+import time
+
+from session_registry import FileSessionRegistry, MemorySessionRegistry
+
+def test_memory_registry_forgets_sessions_after_ttl():
+    registry = MemorySessionRegistry(ttl=0.05)
+    registry.add("a")
+    assert "a" in registry
+    time.sleep(0.1)
+    assert "a" not in registry
+
+    registry.add("b") # Purges expired entries
+    assert "a" not in registry._expires_at
+    assert "b" in registry
+
+def test_file_registry_is_shared_and_forgets_sessions_after_ttl(tmp_path):
+    worker_a = FileSessionRegistry(str(tmp_path), ttl=60)
+    worker_b = FileSessionRegistry(str(tmp_path), ttl=60)
+    worker_a.add("sid/1")
+    assert "sid/1" in worker_b
+
+    # Age the session past the TTL instead of waiting for it
+    stale = time.time() - 120
+    os.utime(worker_a._path("sid/1"), (stale, stale))
+    assert "sid/1" not in worker_b
+
+    worker_b._next_purge = 0.0
+    worker_b.add("sid/2") # Purges expired entries
+    assert not os.path.exists(worker_a._path("sid/1"))
+    assert "sid/2" in worker_a
+
+    worker_a.remove("sid/2")
+    assert "sid/2" not in worker_b
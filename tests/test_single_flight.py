@@ -0,0 +1,51 @@
+import asyncio
+
+from cache import SingleFlight
+
+def test_identical_concurrent_requests_share_one_run():
+    """Mirrors handle_strategy_request: a request arriving while an identical one runs joins it."""
+    flight = SingleFlight("test.pipeline")
+    runs = 0
+    release = asyncio.Event()
+
+    async def pipeline():
+        nonlocal runs
+        runs += 1
+        await release.wait()
+        return "proposal"
+
+    async def handle(key):
+        coalesced = flight.in_flight(key)
+        return coalesced, await flight.do(key, pipeline)
+
+    async def main():
+        first = asyncio.create_task(handle("stake my sol"))
+        await asyncio.sleep(0) # The first request's run is now in flight
+        second = asyncio.create_task(handle("stake my sol"))
+        await asyncio.sleep(0)
+        release.set()
+        return await first, await second
+
+    (first_coalesced, first_result), (second_coalesced, second_result) = asyncio.run(main())
+    assert runs == 1
+    assert (first_coalesced, second_coalesced) == (False, True)
+    assert first_result == second_result == "proposal"
+
+def test_cancelled_follower_does_not_cancel_the_shared_run():
+    flight = SingleFlight("test.cancel")
+    release = asyncio.Event()
+
+    async def pipeline():
+        await release.wait()
+        return "proposal"
+
+    async def main():
+        leader = asyncio.create_task(flight.do("key", pipeline))
+        follower = asyncio.create_task(flight.do("key", pipeline))
+        await asyncio.sleep(0)
+        follower.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await leader, follower.cancelled()
+
+    assert asyncio.run(main()) == ("proposal", True)
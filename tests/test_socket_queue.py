@@ -0,0 +1,37 @@
+import time
+
+import pytest
+
+socketio = pytest.importorskip("socketio")
+
+from socket_queue import FileMessageQueue
+
+class RecordingQueue(FileMessageQueue):
+    """Records the emits relayed from other workers instead of delivering them to clients."""
+
+    def __init__(self, path):
+        super().__init__(path, poll_interval=0.01)
+        self.relayed = []
+
+    def _handle_emit(self, message):
+        self.relayed.append(message)
+
+def test_emit_on_one_worker_reaches_another(tmp_path):
+    path = str(tmp_path / "socketio.jsonl")
+    worker_a = RecordingQueue(path)
+    worker_b = RecordingQueue(path)
+    for manager in (worker_a, worker_b):
+        socketio.Server(client_manager=manager, async_mode="threading")
+        manager.initialize() # Starts the listener thread
+    time.sleep(0.1) # Let both listeners open the file before anything is published
+
+    worker_a.emit("agent_response", {"response": "done"}, room="sid-1")
+
+    deadline = time.monotonic() + 2
+    while not worker_b.relayed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(worker_b.relayed) == 1
+    message = worker_b.relayed[0]
+    assert (message["event"], message["data"], message["room"]) == ("agent_response", [{"response": "done"}], "sid-1")
+    # Worker A handled its own emit locally, and skips it when it reads it back from the file
+    assert len(worker_a.relayed) == 1
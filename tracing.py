@@ -0,0 +1,306 @@
+"""
+Lightweight distributed tracing for the agent pipeline.
+
+Each hop records spans (handler work, queueing, agent transit, LLM and HTTP calls)
+tagged with the user's session_id. The trace context travels between agents on the
+request models (see models.TraceContext). Spans are appended to TRACE_FILE as JSON
+lines and, if TRACE_COLLECTOR_URL is set, also POSTed in batches to a collector.
+Tracing is off unless TRACING_ENABLED=1.
+
+Print the critical-path breakdown of a session with:
+
+    python tracing.py <session_id> [--file traces.jsonl]
+"""
+import argparse
+import atexit
+import contextvars
+import functools
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from contextlib import contextmanager
+from uuid import uuid4
+
+import metrics
+
+# --- Tracing Configuration ---
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+# When the trace file reaches this size it is moved to <TRACE_FILE>.1 and a new one started. 0 never rotates.
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(64 * 1024 * 1024)))
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL") # e.g. an OTLP/HTTP collector stand-in
+# Finished spans are written (and shipped) in batches this often by a background thread
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", os.getenv("TRACE_COLLECTOR_FLUSH_INTERVAL", "1")))
+# Spans waiting to be written; past this, new spans are dropped rather than slowing the agents down
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+# -----------------------------
+
+class Span:
+    """One timed operation in a trace. Times are Unix epoch seconds so spans from different processes line up."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, session_id: str | None, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.session_id = session_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: float | None = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def context(self):
+        """Returns a TraceContext that makes this span the parent of the next hop's spans."""
+        from models import TraceContext
+        return TraceContext(trace_id=self.trace_id, span_id=self.span_id, session_id=self.session_id, sent_at=time.time())
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "session_id": self.session_id,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round((self.end - self.start) * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+class SpanExporter:
+    """
+    Hands finished spans to a background thread, which appends them to a JSONL file and
+    optionally ships them to a collector, in batches. Nothing is written on the caller's
+    thread, so tracing adds no file I/O to an agent's event loop. Spans are dropped (and
+    counted) if the queue is full.
+    """
+
+    def __init__(
+        self,
+        path: str = TRACE_FILE,
+        collector_url: str | None = TRACE_COLLECTOR_URL,
+        max_queue: int = TRACE_QUEUE_SIZE,
+        max_file_bytes: int = TRACE_FILE_MAX_BYTES,
+    ):
+        self.path = path
+        self.collector_url = collector_url
+        self.max_file_bytes = max_file_bytes
+        self._queue: queue.Queue[dict] = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._dropped = metrics.counter("tracing.dropped_spans")
+
+    def export(self, span: Span):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            self._dropped.inc()
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._export_forever, name="trace-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _export_forever(self):
+        while True:
+            time.sleep(TRACE_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """Writes (and ships) every span queued so far."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        self._write(batch)
+        if self.collector_url:
+            self._ship(batch)
+
+    def _write(self, batch: list[dict]):
+        try:
+            # Start a new file once this one is too big, keeping only the previous one
+            if self.max_file_bytes and os.path.getsize(self.path) >= self.max_file_bytes:
+                os.replace(self.path, self.path + ".1")
+        except OSError:
+            pass # No file yet, or another process rotated it first
+        # One O_APPEND write per batch keeps lines from different agent processes intact
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(record, default=str) + "\n" for record in batch))
+
+    def _ship(self, batch: list[dict]):
+        request = urllib.request.Request(
+            self.collector_url,
+            data=json.dumps({"spans": batch}, default=str).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except OSError as e:
+            print(f"Error exporting {len(batch)} spans to {self.collector_url}: {e}")
+
+exporter = SpanExporter()
+
+# The span enclosing the code that is running now. Asyncio tasks inherit it from the code that created them.
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("current_span", default=None)
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+def annotate(**attributes):
+    """Sets attributes on the current span. Does nothing outside a span."""
+    current = current_span()
+    if current is not None:
+        current.set(**attributes)
+
+def _parent_ids(parent) -> tuple[str, str | None, str | None]:
+    """
+    Accepts a Span, a TraceContext or None (meaning the current span, if any) and
+    returns (trace_id, parent_span_id, session_id). With no parent at all a new trace starts.
+    """
+    if parent is None:
+        parent = current_span()
+    if parent is None:
+        return uuid4().hex, None, None
+    return parent.trace_id, parent.span_id, parent.session_id
+
+@contextmanager
+def span(name: str, parent=None, session_id: str | None = None, **attributes):
+    """
+    Times the enclosed block as a span, which becomes the current span inside it.
+    `parent` is a Span or a TraceContext and defaults to the current span.
+    """
+    trace_id, parent_id, parent_session = _parent_ids(parent)
+    current = Span(name, trace_id, parent_id, session_id or parent_session, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end = time.time()
+        if TRACING_ENABLED:
+            exporter.export(current)
+
+def record_span(name: str, start: float, end: float, parent=None, session_id: str | None = None, **attributes) -> Span:
+    """Records a span for an interval that was measured after the fact, e.g. time spent queued."""
+    trace_id, parent_id, parent_session = _parent_ids(parent)
+    recorded = Span(name, trace_id, parent_id, session_id or parent_session, attributes)
+    recorded.start, recorded.end = start, end
+    if TRACING_ENABLED:
+        exporter.export(recorded)
+    return recorded
+
+def record_transit(name: str, trace):
+    """
+    Records the time a message spent between agents (queueing, envelope signing and
+    delivery) from the sender's sent_at to now, and returns it as the parent for the
+    receiver's spans. Returns None if the message carried no trace context.
+    """
+    if trace is None:
+        return None
+    if trace.sent_at is None:
+        return trace
+    return record_span(name, trace.sent_at, time.time(), parent=trace)
+
+def traced_handler(name: str, extract=None):
+    """
+    Decorates an agent message handler so it runs inside a span named `name`, continuing
+    the trace carried by the message (msg.trace, or whatever extract(msg) returns) and
+    recording the message's transit time as "<name>.transit".
+    """
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(ctx, sender, msg):
+            trace = extract(msg) if extract else getattr(msg, "trace", None)
+            parent = record_transit(f"{name}.transit", trace)
+            with span(name, parent=parent, session_id=getattr(msg, "session_id", None), sender=sender):
+                return await handler(ctx, sender, msg)
+        return wrapper
+    return decorator
+
+# --- Critical-path report ---
+
+def load_spans(path: str, session_id: str) -> list[dict]:
+    spans = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue # Partially written line
+            if record.get("session_id") == session_id:
+                spans.append(record)
+    return spans
+
+def critical_path(root: dict, children: dict[str, list[dict]]) -> list[dict]:
+    """Follows, from root, the child that finished last at each level: the chain that decided the latency."""
+    path = [root]
+    kids = children.get(root["span_id"])
+    while kids:
+        last = max(kids, key=lambda s: s["end"])
+        path.append(last)
+        kids = children.get(last["span_id"])
+    return path
+
+def print_report(spans: list[dict]):
+    traces = defaultdict(list)
+    for record in spans:
+        traces[record["trace_id"]].append(record)
+
+    for trace_id, trace_spans in sorted(traces.items(), key=lambda item: min(s["start"] for s in item[1])):
+        ids = {s["span_id"] for s in trace_spans}
+        children = defaultdict(list)
+        roots = []
+        for record in trace_spans:
+            if record["parent_id"] in ids:
+                children[record["parent_id"]].append(record)
+            else:
+                roots.append(record)
+
+        trace_start = min(s["start"] for s in trace_spans)
+        trace_end = max(s["end"] for s in trace_spans)
+        print(f"\nTrace {trace_id}: {len(trace_spans)} spans, {(trace_end - trace_start) * 1000:.1f} ms end to end")
+        print(f"  {'offset ms':>10} {'duration ms':>12} {'self ms':>10}  span")
+        for root in sorted(roots, key=lambda s: s["start"]):
+            path = critical_path(root, children)
+            for depth, record in enumerate(path):
+                next_duration = path[depth + 1]["duration_ms"] if depth + 1 < len(path) else 0
+                self_ms = max(record["duration_ms"] - next_duration, 0)
+                offset_ms = (record["start"] - trace_start) * 1000
+                print(f"  {offset_ms:>10.1f} {record['duration_ms']:>12.1f} {self_ms:>10.1f}  {'  ' * depth}{record['name']}")
+
+        totals = defaultdict(float)
+        for record in trace_spans:
+            totals[record["name"]] += record["duration_ms"]
+        print("  Time by span name:")
+        for name, total in sorted(totals.items(), key=lambda item: -item[1]):
+            print(f"    {total:>10.1f} ms  {name}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the critical-path latency breakdown for a session.")
+    parser.add_argument("session_id")
+    parser.add_argument("--file", default=TRACE_FILE)
+    args = parser.parse_args()
+
+    session_spans = load_spans(args.file, args.session_id)
+    if not session_spans:
+        print(f"No spans found for session {args.session_id} in {args.file}")
+    else:
+        print_report(session_spans)
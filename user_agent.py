@@ -6,7 +6,7 @@ from uuid import uuid4
 import json
 
 from models import StrategyRequest, StrategyResponse, ExecuteStrategy, ExecutionResult, StrategyProposal, CommandMessage, SubmitSignedTransaction, UnsignedTransactionProposal
-from address_book import save_address, get_address
+from address_book import save_address, wait_for_address
 
 # The User Agent (Martian Core)
 user_agent = Agent(
@@ -41,7 +41,7 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
             ctx.logger.info(f"User query: {user_query}")
 
             # Forward user query to Strategy Agent
-            strategy_agent_address = get_address("strategy_agent")
+            strategy_agent_address = await wait_for_address("strategy_agent")
             if not strategy_agent_address:
                 response_content = "Strategy Agent not found. Please ensure it is running."
             else:
@@ -81,7 +81,7 @@ async def handle_command_message(ctx: Context, sender: str, msg: CommandMessage)
         strategy_description = msg.payload.get("strategy_description")
         ctx.logger.info(f"Executing strategy {strategy_id}: {strategy_description}")
 
-        execution_agent_address = get_address("execution_agent")
+        execution_agent_address = await wait_for_address("execution_agent")
         if not execution_agent_address:
             response_content = "Execution Agent not found. Please ensure it is running."
         else:
@@ -111,7 +111,7 @@ async def handle_command_message(ctx: Context, sender: str, msg: CommandMessage)
         strategy_id = msg.payload.get("strategy_id")
         ctx.logger.info(f"Submitting signed transaction for strategy {strategy_id}")
 
-        execution_agent_address = get_address("execution_agent")
+        execution_agent_address = await wait_for_address("execution_agent")
         if not execution_agent_address:
             response_content = "Execution Agent not found. Please ensure it is running."
         else: